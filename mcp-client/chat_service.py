@@ -0,0 +1,352 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from openai_client import (
+    chat,
+    ConnectionManager,
+    build_tools_json,
+    StdioServerParameters,
+)
+from tool_router import ToolRouter
+from completion_cache import create_connection_manager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYSTEM_PROMPT = """You are a helpful assistant with access to a set of tools. Select the most appropriate tool for each request, use it exactly as described by its schema, and present the results clearly. Never mention internal tool names to the user."""
+
+
+class FairToolScheduler:
+    """
+    Shares one ConnectionManager between many conversations.
+
+    MCP sessions multiplex concurrent requests, so tool calls from different
+    conversations can run on the same session. At most `max_concurrency`
+    calls run at once, and waiting calls are dispatched round-robin across
+    conversations so one busy conversation cannot starve the others.
+    """
+
+    def __init__(self, connection_manager, max_concurrency=8):
+        self.connection_manager = connection_manager
+        self.max_concurrency = max_concurrency
+        self._queues = OrderedDict()
+        self._running = 0
+        self._tasks = set()
+
+    async def call_tool(self, conversation_id, tool_name, arguments, tool_map):
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(conversation_id, deque()).append((tool_name, arguments, tool_map, future))
+        self._dispatch()
+        return await future
+
+    def _dispatch(self):
+        while self._running < self.max_concurrency and self._queues:
+            # Take one call from the conversation at the front, then move it to the back
+            conversation_id, queue = self._queues.popitem(last=False)
+            job = queue.popleft()
+            if queue:
+                self._queues[conversation_id] = queue
+            if job[3].cancelled():
+                continue
+            self._running += 1
+            task = asyncio.create_task(self._run(*job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, tool_name, arguments, tool_map, future):
+        try:
+            result = await self.connection_manager.call_tool(tool_name, arguments, tool_map)
+            if not future.done():
+                future.set_result(result)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            self._running -= 1
+            self._dispatch()
+
+
+class ConversationTools:
+    """The `connection_manager` handed to `chat()` for one conversation."""
+
+    def __init__(self, scheduler, conversation_id):
+        self.scheduler = scheduler
+        self.conversation_id = conversation_id
+
+    async def call_tool(self, tool_name, arguments, tool_map):
+        return await self.scheduler.call_tool(self.conversation_id, tool_name, arguments, tool_map)
+
+
+class Conversation:
+    def __init__(self, conversation_id, system_prompt):
+        self.id = conversation_id
+        self.messages = [{"role": "system", "content": system_prompt}]
+        # Messages share one transcript, so they are answered one at a time in
+        # arrival order (asyncio.Lock is FIFO); concurrency comes from tool calls
+        # and from other conversations
+        self.lock = asyncio.Lock()
+        self.last_active = time.monotonic()
+
+
+class ChatService:
+    """
+    Headless, multi-conversation chat service over one shared ConnectionManager.
+
+    Args:
+        connection_manager (ConnectionManager): Shared MCP connections
+        llm_client: OpenAI-compatible client (default: the Groq client from openai_client)
+        tool_top_k (int): Tools sent per LLM request, 0 sends all tools
+        max_tool_concurrency (int): Concurrent tool calls across all conversations
+        max_conversations (int): Oldest idle conversations are dropped beyond this
+    """
+
+    def __init__(
+        self,
+        connection_manager,
+        llm_client=None,
+        tool_top_k=5,
+        max_tool_concurrency=8,
+        max_conversations=10_000,
+    ):
+        self.connection_manager = connection_manager
+        self.llm_client = llm_client
+        self.tool_top_k = tool_top_k
+        self.scheduler = FairToolScheduler(connection_manager, max_tool_concurrency)
+        self.max_conversations = max_conversations
+        self.conversations = OrderedDict()
+        self.tool_map, self.tools_json, self.tool_router = {}, [], None
+
+    async def start(self):
+        await self.connection_manager.initialize()
+        self.tool_map, tool_objects = await self.connection_manager.list_tools()
+        self.tools_json = build_tools_json(tool_objects)
+        if self.tool_top_k:
+            self.tool_router = ToolRouter(self.tools_json, top_k=self.tool_top_k)
+        logger.info(f"Chat service ready with {len(self.tools_json)} tools")
+
+    async def stop(self):
+        await self.connection_manager.close()
+
+    def create_conversation(self, system_prompt=None):
+        conversation = Conversation(uuid.uuid4().hex, system_prompt or DEFAULT_SYSTEM_PROMPT)
+        self.conversations[conversation.id] = conversation
+        while len(self.conversations) > self.max_conversations:
+            self.conversations.popitem(last=False)
+        return conversation
+
+    async def send(self, conversation, content):
+        """
+        Run one user message through `chat()` and yield its responses.
+
+        A message sent while the conversation is still answering an earlier
+        one waits for it, so each turn sees a complete transcript.
+        """
+        async with conversation.lock:
+            if conversation.id in self.conversations:
+                self.conversations.move_to_end(conversation.id)
+            conversation.last_active = time.monotonic()
+            conversation.messages.append({"role": "user", "content": content})
+            async for response in chat(
+                conversation.messages,
+                self.tool_map,
+                tools=self.tools_json,
+                connection_manager=ConversationTools(self.scheduler, conversation.id),
+                tool_router=self.tool_router,
+                llm_client=self.llm_client,
+                transcript=conversation.messages,
+            ):
+                yield response
+
+
+def create_app(service, executor_workers=64):
+    """Create a Starlette application exposing the chat service over HTTP."""
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # LLM requests run in threads; size the pool for many concurrent conversations
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=executor_workers))
+        await service.start()
+        try:
+            yield
+        finally:
+            await service.stop()
+
+    async def health(request: Request):
+        return JSONResponse({"status": "ok", "conversations": len(service.conversations)})
+
+    async def create_conversation(request: Request):
+        body = await request.json() if await request.body() else {}
+        conversation = service.create_conversation(body.get("system_prompt"))
+        return JSONResponse({"id": conversation.id}, status_code=201)
+
+    async def get_conversation(request: Request):
+        conversation = service.conversations.get(request.path_params["conversation_id"])
+        if conversation is None:
+            return JSONResponse({"error": "Conversation not found"}, status_code=404)
+        messages = [m for m in conversation.messages if m["role"] != "system"]
+        return JSONResponse({"id": conversation.id, "messages": messages})
+
+    async def post_message(request: Request):
+        conversation = service.conversations.get(request.path_params["conversation_id"])
+        if conversation is None:
+            return JSONResponse({"error": "Conversation not found"}, status_code=404)
+        try:
+            content = (await request.json())["content"]
+        except Exception:
+            return JSONResponse({"error": "Expected a JSON body with 'content'"}, status_code=400)
+
+        async def stream():
+            # One JSON object per line, flushed as each response is produced
+            async for response in service.send(conversation, content):
+                yield json.dumps(response) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    return Starlette(
+        routes=[
+            Route("/health", endpoint=health),
+            Route("/conversations", endpoint=create_conversation, methods=["POST"]),
+            Route("/conversations/{conversation_id}", endpoint=get_conversation),
+            Route("/conversations/{conversation_id}/messages", endpoint=post_message, methods=["POST"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def load_server_config(path):
+    """Load {"stdio": {...}, "sse": {...}} in the same format as the Streamlit sidebar."""
+    if not path:
+        return {}, {}
+    with open(path) as f:
+        config = json.load(f)
+    stdio_server_map = {
+        name: StdioServerParameters(**params) for name, params in config.get("stdio", {}).items()
+    }
+    return stdio_server_map, config.get("sse", {})
+
+
+async def run_benchmark(conversations, concurrency, llm_latency, tool_latency):
+    """
+    Measure conversations per second through the HTTP layer with a simulated
+    LLM and tool backend, so only the service itself is being measured.
+
+    Raises RuntimeError if any conversation streamed an error event, since
+    failing conversations would otherwise inflate the throughput.
+    """
+    from types import SimpleNamespace
+
+    import httpx
+
+    class SimulatedLLM:
+        """Answers with one tool call, then with a final message."""
+
+        def __init__(self):
+            self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+        def create(self, model, messages, tools=None):
+            time.sleep(llm_latency)
+            if tools and not any(
+                (m.get("role") if isinstance(m, dict) else m.role) == "tool" for m in messages[-2:]
+            ):
+                call = SimpleNamespace(
+                    id=uuid.uuid4().hex,
+                    function=SimpleNamespace(name="echo", arguments=json.dumps({"text": "hi"})),
+                )
+                message = SimpleNamespace(role="assistant", content=None, tool_calls=[call])
+                return SimpleNamespace(choices=[SimpleNamespace(finish_reason="tool_calls", message=message)])
+            message = SimpleNamespace(role="assistant", content="done", tool_calls=None)
+            return SimpleNamespace(choices=[SimpleNamespace(finish_reason="stop", message=message)])
+
+    class SimulatedConnections:
+        async def initialize(self):
+            pass
+
+        async def list_tools(self):
+            tool = SimpleNamespace(
+                name="echo",
+                description="Echo text back",
+                inputSchema={"type": "object", "properties": {"text": {"type": "string"}}},
+            )
+            return {"echo": "sim"}, [tool]
+
+        async def call_tool(self, tool_name, arguments, tool_map):
+            await asyncio.sleep(tool_latency)
+            return arguments["text"]
+
+        async def close(self):
+            pass
+
+    service = ChatService(SimulatedConnections(), llm_client=SimulatedLLM(), tool_top_k=0)
+    app = create_app(service, executor_workers=concurrency)
+    limit = asyncio.Semaphore(concurrency)
+    errors = []
+
+    async def one_conversation(http):
+        async with limit:
+            conversation_id = (await http.post("/conversations")).json()["id"]
+            async with http.stream(
+                "POST", f"/conversations/{conversation_id}/messages", json={"content": "say hi"}
+            ) as response:
+                async for line in response.aiter_lines():
+                    if line.strip():
+                        event = json.loads(line)
+                        if event.get("type") == "error":
+                            errors.append(event.get("content"))
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            start = time.perf_counter()
+            await asyncio.gather(*(one_conversation(http) for _ in range(conversations)))
+            elapsed = time.perf_counter() - start
+
+    print(f"{conversations} conversations, concurrency {concurrency}, "
+          f"LLM latency {llm_latency * 1000:.0f}ms, tool latency {tool_latency * 1000:.0f}ms")
+    print(f"elapsed: {elapsed:.2f}s, throughput: {conversations / elapsed:.1f} conversations/s")
+    print(f"error events: {len(errors)}")
+    if errors:
+        raise RuntimeError(f"{len(errors)} error events during the benchmark, first: {errors[0]}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the headless multi-conversation chat service")
+    parser.add_argument("--config", default=None, help='JSON file with {"stdio": {...}, "sse": {...}} servers')
+    parser.add_argument("--host", default="0.0.0.0", help="Host to bind to")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--lazy", action="store_true", help="Start MCP servers on first use")
+    parser.add_argument("--tool-top-k", type=int, default=5, help="Tools sent per LLM request (0 = all)")
+    parser.add_argument("--max-tool-concurrency", type=int, default=8, help="Concurrent tool calls overall")
+    parser.add_argument("--benchmark", action="store_true", help="Run the throughput benchmark and exit")
+    parser.add_argument("--conversations", type=int, default=500, help="Benchmark: number of conversations")
+    parser.add_argument("--concurrency", type=int, default=64, help="Benchmark: concurrent conversations")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Benchmark: simulated LLM latency (s)")
+    parser.add_argument("--tool-latency", type=float, default=0.05, help="Benchmark: simulated tool latency (s)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        logging.getLogger().setLevel(logging.WARNING)
+        asyncio.run(run_benchmark(args.conversations, args.concurrency, args.llm_latency, args.tool_latency))
+    else:
+        stdio_server_map, sse_server_map = load_server_config(args.config)
+        service = ChatService(
+            create_connection_manager(
+                lambda: ConnectionManager(stdio_server_map, sse_server_map, lazy=args.lazy)
+            ),
+            tool_top_k=args.tool_top_k,
+            max_tool_concurrency=args.max_tool_concurrency,
+        )
+        uvicorn.run(create_app(service), host=args.host, port=args.port)
@@ -0,0 +1,339 @@
+import abc
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, defaultdict, deque
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+
+def to_jsonable(value):
+    """
+    Plain JSON-ready copy of SDK objects (pydantic models, or any objects with
+    a `__dict__`), dicts and lists, with None fields dropped.
+    """
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if hasattr(value, "__dict__"):
+        return to_jsonable(vars(value))
+    return value
+
+
+def request_key(**kwargs):
+    """
+    Canonical hash of a completion request (model, messages, tools and any other options).
+
+    SDK message objects and plain dicts with the same content hash identically.
+    """
+    canonical = json.dumps(to_jsonable(kwargs), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _dump_completion(result):
+    return result.model_dump() if hasattr(result, "model_dump") else to_jsonable(result)
+
+
+def _load_completion(data):
+    from openai.types.chat import ChatCompletion
+    return ChatCompletion.model_validate(data)
+
+
+class CompletionClient(abc.ABC):
+    """Base for wrappers exposing the `client.chat.completions.create(...)` interface."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @abc.abstractmethod
+    def create(self, **kwargs):
+        """Return a chat completion for the given request arguments."""
+
+
+class CachedCompletionClient(CompletionClient):
+    """
+    LRU + on-disk response cache in front of an OpenAI-compatible client.
+
+    Args:
+        client: The wrapped client
+        max_entries (int): In-memory LRU size
+        path (str): Optional SQLite file for a persistent cache
+    """
+
+    def __init__(self, client, max_entries=256, path=None):
+        super().__init__()
+        self.client = client
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0}
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, response TEXT NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return self._lru[key]
+            if self._conn is not None:
+                row = self._conn.execute("SELECT response FROM completions WHERE key = ?", (key,)).fetchone()
+                if row:
+                    data = json.loads(row[0])
+                    self._remember(key, data)
+                    return data
+        return None
+
+    def _remember(self, key, data):
+        self._lru[key] = data
+        if len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def create(self, **kwargs):
+        key = request_key(**kwargs)
+        data = self._lookup(key)
+        if data is not None:
+            self.stats["hits"] += 1
+            logger.info(f"Completion cache hit ({key[:12]})")
+            return _load_completion(data)
+
+        self.stats["misses"] += 1
+        result = self.client.chat.completions.create(**kwargs)
+        data = _dump_completion(result)
+        with self._lock:
+            self._remember(key, data)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO completions (key, response) VALUES (?, ?)",
+                    (key, json.dumps(data)),
+                )
+                self._conn.commit()
+        return result
+
+
+class RecordingCompletionClient(CompletionClient):
+    """Forwards requests and appends every (key, request, completion) to a JSONL session file."""
+
+    def __init__(self, client, path):
+        super().__init__()
+        self.client = client
+        self.path = path
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        result = self.client.chat.completions.create(**kwargs)
+        entry = {
+            "key": request_key(**kwargs),
+            "request": to_jsonable(kwargs),
+            "response": _dump_completion(result),
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+        return result
+
+
+def _load_session(path):
+    """
+    Read a recorded session file into per-kind queues of responses keyed by request.
+
+    Completion entries have no "kind"; tool results have kind "tool" and the
+    tool listing kind "tools" (the last one recorded wins).
+    """
+    session = {"completion": defaultdict(deque), "tool": defaultdict(deque), "tools": None}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                kind = entry.get("kind", "completion")
+                if kind == "tools":
+                    session["tools"] = entry
+                else:
+                    session[kind][entry["key"]].append(entry["response"])
+    return session
+
+
+def _next_response(queue):
+    # Keep the last response so a replayed session can be re-run
+    return queue.popleft() if len(queue) > 1 else queue[0]
+
+
+class ReplayCompletionClient(CompletionClient):
+    """
+    Serves completions from a recorded session file without network access.
+
+    Identical requests are answered in the order they were recorded. A
+    request that was never recorded raises an error instead of guessing.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._responses = _load_session(path)["completion"]
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        key = request_key(**kwargs)
+        with self._lock:
+            queue = self._responses.get(key)
+            if not queue:
+                raise LookupError(f"No recorded completion for request {key[:12]} in {self.path}")
+            data = _next_response(queue)
+        return _load_completion(data)
+
+
+def tool_key(tool_name, arguments):
+    """Canonical hash of a tool call (tool name and arguments)."""
+    return request_key(tool=tool_name, arguments=arguments)
+
+
+class RecordingConnectionManager:
+    """
+    Wraps a ConnectionManager and appends the tool listing and every tool
+    result to the session file, next to the recorded completions.
+
+    Everything other than `list_tools` and `call_tool` is delegated unchanged.
+    """
+
+    def __init__(self, connection_manager, path):
+        self.connection_manager = connection_manager
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.connection_manager, name)
+
+    def _write(self, entry):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+
+    async def list_tools(self):
+        tool_map, tool_objects = await self.connection_manager.list_tools()
+        self._write({
+            "kind": "tools",
+            "tool_map": tool_map,
+            "tools": [
+                {"name": tool.name, "description": tool.description, "inputSchema": tool.inputSchema}
+                for tool in tool_objects
+            ],
+        })
+        return tool_map, tool_objects
+
+    async def call_tool(self, tool_name, arguments, tool_map):
+        result = await self.connection_manager.call_tool(tool_name, arguments, tool_map)
+        self._write({
+            "kind": "tool",
+            "key": tool_key(tool_name, arguments),
+            "request": {"tool": tool_name, "arguments": to_jsonable(arguments)},
+            "response": result,
+        })
+        return result
+
+
+class ReplayConnectionManager:
+    """
+    Stands in for a ConnectionManager when replaying a recorded session.
+
+    Tools are listed and answered from the session file, so no MCP server is
+    started or contacted. Identical calls are answered in recorded order; an
+    unrecorded call raises an error instead of guessing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        session = _load_session(path)
+        self._tools = session["tools"] or {"tool_map": {}, "tools": []}
+        self._results = session["tool"]
+        self._lock = threading.Lock()
+        # No live sessions: servers are "started on demand", i.e. never
+        self.lazy = True
+        self.sessions = {}
+
+    async def initialize(self):
+        logger.info(f"Replaying tool results from {self.path}")
+
+    async def list_tools(self):
+        tool_objects = [SimpleNamespace(**tool) for tool in self._tools["tools"]]
+        return dict(self._tools["tool_map"]), tool_objects
+
+    async def call_tool(self, tool_name, arguments, tool_map):
+        key = tool_key(tool_name, arguments)
+        with self._lock:
+            queue = self._results.get(key)
+            if not queue:
+                raise LookupError(f"No recorded result for tool call {tool_name} ({key[:12]}) in {self.path}")
+            return _next_response(queue)
+
+    async def close(self):
+        pass
+
+
+def create_completion_client(client_factory):
+    """
+    Build the LLM client for the chat loop from environment settings.
+
+    All layers are opt-in:
+        LLM_REPLAY_PATH        replay a recorded session (the real client is never created)
+        LLM_RECORD_PATH        record every completion to this JSONL file
+        LLM_CACHE=1            enable the response cache
+        LLM_CACHE_PATH         persist the cache to this SQLite file
+        LLM_CACHE_SIZE         in-memory LRU entries (default 256)
+
+    Args:
+        client_factory (callable): Returns the real OpenAI-compatible client
+
+    Returns:
+        The client, possibly wrapped in cache and/or recording layers
+    """
+    replay_path = os.getenv("LLM_REPLAY_PATH")
+    if replay_path:
+        logger.info(f"Replaying LLM completions from {replay_path}")
+        return ReplayCompletionClient(replay_path)
+
+    llm_client = client_factory()
+    if os.getenv("LLM_CACHE", "0") == "1":
+        llm_client = CachedCompletionClient(
+            llm_client,
+            max_entries=int(os.getenv("LLM_CACHE_SIZE", "256")),
+            path=os.getenv("LLM_CACHE_PATH"),
+        )
+    record_path = os.getenv("LLM_RECORD_PATH")
+    if record_path:
+        logger.info(f"Recording LLM completions to {record_path}")
+        llm_client = RecordingCompletionClient(llm_client, record_path)
+    return llm_client
+
+
+def create_connection_manager(manager_factory):
+    """
+    Build the MCP connection manager for the chat loop, honouring the same
+    record/replay settings as `create_completion_client`.
+
+        LLM_REPLAY_PATH        list tools and answer tool calls from the recording
+                               (the real manager is never created)
+        LLM_RECORD_PATH        record the tool listing and every tool result
+
+    Args:
+        manager_factory (callable): Returns the real ConnectionManager
+
+    Returns:
+        The manager, possibly wrapped in a recording layer, or a replay stand-in
+    """
+    replay_path = os.getenv("LLM_REPLAY_PATH")
+    if replay_path:
+        return ReplayConnectionManager(replay_path)
+    connection_manager = manager_factory()
+    record_path = os.getenv("LLM_RECORD_PATH")
+    if record_path:
+        connection_manager = RecordingConnectionManager(connection_manager, record_path)
+    return connection_manager
@@ -5,9 +5,11 @@ import json
 from openai_client import (
     chat,
     ConnectionManager,
-    filter_input_schema,
+    build_tools_json,
     StdioServerParameters,
 )
+from tool_router import ToolRouter
+from completion_cache import create_connection_manager
 
 #Streamlit App title
 st.title("MCP Client")
@@ -48,6 +50,20 @@ sse_servers = st.sidebar.text_area(
     ),
 )
 
+# Number of tools sent per LLM request (0 sends every tool)
+tool_router_top_k = st.sidebar.number_input(
+    "Tools per request (0 = all)", min_value=0, value=5, step=1
+)
+
+# Start servers only when one of their tools is first called (tools are listed from a cached manifest).
+# Off by default: the connection manager is rebuilt for every message, so health
+# pings and idle shutdown never get to run here.
+lazy_servers = st.sidebar.checkbox(
+    "Start servers on first use",
+    value=False,
+    help="Servers with a cached tool manifest are only started when one of their tools is called.",
+)
+
 try:
     stdio_server_map = {
         name: StdioServerParameters(**params)
@@ -94,37 +110,58 @@ if "messages" not in st.session_state:
    - Foster a helpful and seamless user experience through precise and proactive tool utilization.
 
 """
+    # Model transcript: system/user messages plus the real assistant and tool messages
     st.session_state.messages = [{"role": "system", "content": system_message}]
+    # Display log: one entry per exchange with the user text, tool logs and answer
+    st.session_state.display = []
+
+# Only the most recent exchanges are rendered on each rerun
+HISTORY_WINDOW = 10
+
+
+def render_tool_logs(container, tool_logs):
+    with container.expander(f"Tool activity ({len(tool_logs)} steps)"):
+        for log in tool_logs:
+            st.markdown(log)
+
+
+def render_exchange(exchange):
+    with st.chat_message("user"):
+        st.markdown(exchange["user"])
+    with st.chat_message("assistant"):
+        if exchange["tools"]:
+            render_tool_logs(st, exchange["tools"])
+        st.markdown(exchange["answer"])
+
 
 # Display chat messages from history
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        if message["role"] == "user":
-            st.markdown(message["content"])
+history = st.session_state.display
+if len(history) > HISTORY_WINDOW and st.checkbox(
+    f"Show {len(history) - HISTORY_WINDOW} earlier messages"
+):
+    visible = history
+else:
+    visible = history[-HISTORY_WINDOW:]
+for exchange in visible:
+    render_exchange(exchange)
 
 # Async function to handle chat and stream messages
 async def handle_chat(connection_manager):
     # Fetch available tools from configured servers
     tool_map, tool_objects = await connection_manager.list_tools()
-    tools_json = [
-        {
-            "type": "function",
-            "function": {
-                "name": tool.name,
-                "description": tool.description,
-                "strict": True,
-                "parameters": filter_input_schema(tool.inputSchema),
-            },
-        }
-        for tool in tool_objects
-    ]
-
-    # Stream responses from the chat function
+    tools_json = build_tools_json(tool_objects)
+
+    # Shortlist the relevant tools per turn instead of sending the whole catalog
+    tool_router = ToolRouter(tools_json, top_k=tool_router_top_k) if tool_router_top_k else None
+
+    # Stream responses from the chat function; the transcript is updated in place
     async for response in chat(
         st.session_state.messages,
         tool_map,
         tools=tools_json,
         connection_manager=connection_manager,
+        tool_router=tool_router,
+        transcript=st.session_state.messages,
     ):
         yield response
 
@@ -133,26 +170,37 @@ async def handle_chat(connection_manager):
 if user_message := st.chat_input("Your Message"):
     # Display user message in chat container
     st.chat_message("user").markdown(user_message)
-    # Add user message to chat history
+    # Add user message to the model transcript
     st.session_state.messages.append({"role": "user", "content": user_message})
+    exchange = {"user": user_message, "tools": [], "answer": ""}
 
     # Process assistant response
-    with st.spinner("Assistant is typing..."):
-        response_container = st.chat_message("assistant")
+    with st.chat_message("assistant"):
+        # Placeholders are updated in place as events stream in
+        tools_placeholder = st.empty()
+        answer_placeholder = st.empty()
 
         async def stream_responses():
-            # Initialize ConnectionManager
-            connection_manager = ConnectionManager(stdio_server_map, sse_server_map)
+            # Initialize ConnectionManager (or its record/replay wrapper, see completion_cache)
+            connection_manager = create_connection_manager(
+                lambda: ConnectionManager(stdio_server_map, sse_server_map, lazy=lazy_servers)
+            )
             await connection_manager.initialize()
 
             try:
-                # Stream assistant responses and update chat history
+                # Stream assistant responses into the display log
                 async for response in handle_chat(connection_manager):
-                    response_container.markdown(response["content"])
-                    st.session_state.messages.append(response)
+                    if response.get("type") in ("tool_call", "tool_observation"):
+                        exchange["tools"].append(response["content"])
+                        render_tool_logs(tools_placeholder.container(), exchange["tools"])
+                    else:
+                        exchange["answer"] = response["content"]
+                        answer_placeholder.markdown(exchange["answer"])
             finally:
                 # Ensure connections are closed
                 await connection_manager.close()
 
-        asyncio.run(stream_responses())
+        with st.spinner("Assistant is typing..."):
+            asyncio.run(stream_responses())
 
+    st.session_state.display.append(exchange)
@@ -1,14 +1,19 @@
 import asyncio
 from contextlib import AsyncExitStack
 from mcp import ClientSession, StdioServerParameters
+from mcp.types import Tool
 from mcp.client.stdio import stdio_client
 from mcp.client.sse import sse_client
 from openai import OpenAI
 from dotenv import load_dotenv
+from tool_router import ToolRouter
+from completion_cache import create_completion_client, create_connection_manager, to_jsonable
+import hashlib
 import json
 import logging
 import sys
 import os
+import time
 
 # Configure logging
 logging.basicConfig(
@@ -26,66 +31,284 @@ load_dotenv()
 #     base_url='http://localhost:11434/v1',
 #     api_key='ollama',  # required, but unused
 # )
-client = OpenAI(
-    base_url='https://api.groq.com/openai/v1',
-    api_key=os.getenv("GROQ_API_KEY"),  # required, but unused
+# Optional response cache and record/replay layers are enabled via environment
+# variables (see completion_cache.create_completion_client)
+client = create_completion_client(
+    lambda: OpenAI(
+        base_url='https://api.groq.com/openai/v1',
+        api_key=os.getenv("GROQ_API_KEY"),  # required, but unused
     )
+)
 
 
 class ConnectionManager:
-    def __init__(self, stdio_server_map, sse_server_map):
+    """
+    Owns the MCP sessions for the configured stdio and SSE servers.
+
+    Each server connection runs in its own task, so a single server can be
+    stopped or restarted without touching the others. In lazy mode servers
+    are listed from a cached tool manifest and only spawned when one of their
+    tools is first called; every spawn re-lists the server's tools into the
+    manifest, so it stays current for the next start. The manifest stores
+    only a hash of each server's config, never its environment values. A
+    background health check pings live sessions,
+    reconnects dead ones with backoff and, in lazy mode, shuts down stdio
+    servers that have been idle for `idle_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        stdio_server_map,
+        sse_server_map,
+        lazy=False,
+        manifest_path=None,
+        health_interval=30.0,
+        ping_timeout=5.0,
+        idle_timeout=300.0,
+        max_retries=3,
+    ):
         self.stdio_server_map = stdio_server_map
         self.sse_server_map = sse_server_map
+        self.lazy = lazy
+        self.manifest_path = manifest_path or os.path.join(os.getcwd(), "mcp_tool_manifest.json")
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
         self.sessions = {}
-        self.exit_stack = AsyncExitStack()
+        self.manifest = {}
+        self._runners = {}
+        self._locks = {}
+        self._last_used = {}
+        self._in_flight = {}
+        self._health_task = None
+
+    @property
+    def server_names(self):
+        return list(self.stdio_server_map) + list(self.sse_server_map)
+
+    def _kind(self, server_name):
+        return "stdio" if server_name in self.stdio_server_map else "SSE"
+
+    def _config_key(self, server_name):
+        if server_name in self.stdio_server_map:
+            params = self.stdio_server_map[server_name]
+            config = params.model_dump(mode="json") if hasattr(params, "model_dump") else params
+        else:
+            config = self.sse_server_map[server_name]
+        # Hashed, so secrets in the server's env never reach the manifest file
+        canonical = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
-    async def initialize(self):
-        # Initialize stdio connections
-        for server_name, params in self.stdio_server_map.items():
-            try:
-                logger.info(f"Connecting to stdio server: {server_name}")
-                stdio_transport = await self.exit_stack.enter_async_context(
-                    stdio_client(params)
-                )
-                read, write = stdio_transport
-                session = await self.exit_stack.enter_async_context(
-                    ClientSession(read, write)
-                )
+    def _transport(self, server_name):
+        if server_name in self.stdio_server_map:
+            return stdio_client(self.stdio_server_map[server_name])
+        return sse_client(url=self.sse_server_map[server_name])
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable tool manifest {self.manifest_path}: {e}")
+            return {}
+
+    def _save_manifest(self):
+        try:
+            with open(self.manifest_path, "w") as f:
+                json.dump(self.manifest, f, indent=2)
+        except Exception as e:
+            logger.warning(f"Failed to write tool manifest {self.manifest_path}: {e}")
+
+    def _manifest_tools(self, server_name):
+        """Return the cached tools for a server, or None if missing or stale."""
+        cached = self.manifest.get(server_name)
+        if cached and cached.get("config") == self._config_key(server_name):
+            return [Tool(**tool) for tool in cached["tools"]]
+        return None
+
+    async def _record_tools(self, server_name, session):
+        """List a server's tools and store them in the in-memory manifest; None on failure."""
+        try:
+            tools = (await session.list_tools()).tools
+        except Exception as e:
+            logger.error(f"Failed to list tools from {server_name}: {e}")
+            return None
+        self.manifest[server_name] = {
+            "config": self._config_key(server_name),
+            "tools": [
+                {"name": tool.name, "description": tool.description, "inputSchema": tool.inputSchema}
+                for tool in tools
+            ],
+        }
+        return tools
+
+    async def _run_server(self, server_name, ready, stop):
+        # Transport and session contexts must be entered and exited in the same task
+        session = None
+        try:
+            async with AsyncExitStack() as stack:
+                read, write = await stack.enter_async_context(self._transport(server_name))
+                session = await stack.enter_async_context(ClientSession(read, write))
                 await session.initialize()
                 self.sessions[server_name] = session
-                logger.info(f"Successfully connected to stdio server: {server_name}")
-            except Exception as e:
-                logger.error(f"Failed to connect to stdio server {server_name}: {e}")
+                ready.set_result(session)
+                await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.error(f"Connection to {server_name} ended with an error: {e}")
+        finally:
+            if session is not None and self.sessions.get(server_name) is session:
+                del self.sessions[server_name]
 
-        # Initialize SSE connections
-        for server_name, url in self.sse_server_map.items():
+    async def _connect(self, server_name):
+        kind = self._kind(server_name)
+        if server_name in self.sse_server_map:
+            logger.info(f"Connecting to {kind} server: {server_name} at {self.sse_server_map[server_name]}")
+        else:
+            logger.info(f"Connecting to {kind} server: {server_name}")
+        ready = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+        task = asyncio.create_task(self._run_server(server_name, ready, stop))
+        self._runners[server_name] = (task, stop)
+        try:
+            session = await ready
+        except BaseException:
+            self._runners.pop(server_name, None)
+            raise
+        self._last_used[server_name] = time.monotonic()
+        logger.info(f"Successfully connected to {kind} server: {server_name}")
+        return session
+
+    async def _disconnect(self, server_name):
+        runner = self._runners.pop(server_name, None)
+        if runner:
+            task, stop = runner
+            stop.set()
             try:
-                logger.info(f"Connecting to SSE server: {server_name} at {url}")
-                sse_transport = await self.exit_stack.enter_async_context(
-                    sse_client(url=url)
-                )
-                read, write = sse_transport
-                session = await self.exit_stack.enter_async_context(
-                    ClientSession(read, write)
-                )
-                await session.initialize()
-                self.sessions[server_name] = session
-                logger.info(f"Successfully connected to SSE server: {server_name}")
+                await asyncio.wait_for(task, timeout=10)
+            except Exception as e:
+                logger.error(f"Error while closing {server_name}: {e}")
+        self.sessions.pop(server_name, None)
+
+    async def _reconnect(self, server_name, attempts=None):
+        attempts = attempts or self.max_retries
+        delay = 1.0
+        for attempt in range(1, attempts + 1):
+            await self._disconnect(server_name)
+            try:
+                return await self._connect(server_name)
             except Exception as e:
-                logger.error(f"Failed to connect to SSE server {server_name}: {e}")
-                # Continue with other connections instead of failing completely
+                logger.error(
+                    f"Failed to connect to {self._kind(server_name)} server {server_name} "
+                    f"(attempt {attempt}/{attempts}): {e}"
+                )
+                if attempt < attempts:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+        return None
+
+    async def _is_alive(self, session):
+        try:
+            await asyncio.wait_for(session.send_ping(), timeout=self.ping_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def get_session(self, server_name, attempts=None):
+        """
+        Return a live session, spawning or reconnecting the server if needed.
+
+        `attempts` overrides `max_retries` for this call (listing tools uses a
+        single attempt so an unreachable server does not stall every turn).
+        """
+        if server_name not in self.stdio_server_map and server_name not in self.sse_server_map:
+            return None
+        async with self._locks.setdefault(server_name, asyncio.Lock()):
+            session = self.sessions.get(server_name)
+            if session is None:
+                session = await self._reconnect(server_name, attempts)
+                if self.lazy and session is not None and await self._record_tools(server_name, session):
+                    self._save_manifest()
+            if session is not None:
+                self._last_used[server_name] = time.monotonic()
+            return session
+
+    async def initialize(self):
+        self.manifest = self._load_manifest()
+        if self.lazy:
+            logger.info(f"Lazy mode: {len(self.server_names)} servers will start on first use")
+        else:
+            for server_name in self.server_names:
+                try:
+                    await self._connect(server_name)
+                except Exception as e:
+                    logger.error(f"Failed to connect to {self._kind(server_name)} server {server_name}: {e}")
+                    # Continue with other connections instead of failing completely
+
+        if self.health_interval:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            now = time.monotonic()
+            for server_name, session in list(self.sessions.items()):
+                try:
+                    lock = self._locks.setdefault(server_name, asyncio.Lock())
+                    if lock.locked():
+                        continue
+                    async with lock:
+                        idle = now - self._last_used.get(server_name, now)
+                        if (
+                            self.lazy
+                            and self.idle_timeout
+                            and server_name in self.stdio_server_map
+                            and not self._in_flight.get(server_name)
+                            and idle > self.idle_timeout
+                        ):
+                            logger.info(f"Shutting down idle stdio server: {server_name}")
+                            await self._disconnect(server_name)
+                        elif not await self._is_alive(session):
+                            logger.warning(f"Health check failed for {server_name}")
+                            if self.lazy:
+                                # Respawned on next use
+                                await self._disconnect(server_name)
+                            else:
+                                await self._reconnect(server_name)
+                except Exception as e:
+                    logger.error(f"Health check error for {server_name}: {e}")
 
     async def list_tools(self):
         tool_map = {}
         consolidated_tools = []
-        for server_name, session in self.sessions.items():
-            try:
-                tools = await session.list_tools()
-                tool_map.update({tool.name: server_name for tool in tools.tools})
-                consolidated_tools.extend(tools.tools)
-                logger.info(f"Listed {len(tools.tools)} tools from {server_name}")
-            except Exception as e:
-                logger.error(f"Failed to list tools from {server_name}: {e}")
+        manifest_changed = False
+        for server_name in self.server_names:
+            if self.lazy:
+                tools = self._manifest_tools(server_name)
+                if tools is None:
+                    # Spawning the server lists its tools into the manifest
+                    await self.get_session(server_name, attempts=1)
+                    tools = self._manifest_tools(server_name)
+                if tools is None:
+                    continue
+            else:
+                session = self.sessions.get(server_name)
+                if session is None:
+                    continue
+                tools = await self._record_tools(server_name, session)
+                if tools is None:
+                    continue
+                manifest_changed = True
+            tool_map.update({tool.name: server_name for tool in tools})
+            consolidated_tools.extend(tools)
+            logger.info(f"Listed {len(tools)} tools from {server_name}")
+        if manifest_changed:
+            self._save_manifest()
         return tool_map, consolidated_tools
 
     async def call_tool(self, tool_name, arguments, tool_map):
@@ -94,21 +317,41 @@ class ConnectionManager:
             logger.warning(f"Tool '{tool_name}' not found in tool map")
             return f"Error: Tool '{tool_name}' not found."
 
-        session = self.sessions.get(server_name)
-        if not session:
-            logger.warning(f"No session available for server '{server_name}'")
-            return f"Error: Server '{server_name}' is not connected."
-        
-        try:
-            result = await session.call_tool(tool_name, arguments=arguments)
-            return result.content[0].text
-        except Exception as e:
-            logger.error(f"Error calling tool {tool_name}: {e}")
-            return f"Error executing tool {tool_name}: {str(e)}"
+        for attempt in range(2):
+            session = await self.get_session(server_name)
+            if not session:
+                logger.warning(f"No session available for server '{server_name}'")
+                return f"Error: Server '{server_name}' is not connected."
+
+            self._in_flight[server_name] = self._in_flight.get(server_name, 0) + 1
+            try:
+                result = await session.call_tool(tool_name, arguments=arguments)
+                return result.content[0].text
+            except Exception as e:
+                logger.error(f"Error calling tool {tool_name}: {e}")
+                if attempt == 0 and not await self._is_alive(session):
+                    # The server died; restart it and retry the call once
+                    logger.info(f"Server '{server_name}' is unresponsive; reconnecting")
+                    async with self._locks.setdefault(server_name, asyncio.Lock()):
+                        if self.sessions.get(server_name) is session:
+                            await self._disconnect(server_name)
+                    continue
+                return f"Error executing tool {tool_name}: {str(e)}"
+            finally:
+                self._in_flight[server_name] -= 1
+                self._last_used[server_name] = time.monotonic()
 
     async def close(self):
         try:
-            await self.exit_stack.aclose()
+            if self._health_task:
+                self._health_task.cancel()
+                try:
+                    await self._health_task
+                except asyncio.CancelledError:
+                    pass
+                self._health_task = None
+            for server_name in list(self._runners):
+                await self._disconnect(server_name)
             logger.info("All connections closed successfully")
         except Exception as e:
             logger.error(f"Error while closing connections: {e}")
@@ -121,19 +364,34 @@ async def chat(
     tools=[],
     max_turns=10,
     connection_manager=None,
+    tool_router=None,
+    llm_client=None,
+    transcript=None,
 ):
+    # Yields display events ({"role", "type", "content"}); when `transcript` is
+    # given, the real assistant/tool messages are appended to it for the next request
+    llm_client = llm_client or client
     chat_messages = input_messages[:]
     for turn in range(max_turns):
         logger.info(f"Chat turn {turn+1}/{max_turns}")
         try:
-            result = client.chat.completions.create(
+            # Send only the tools relevant to this turn when a router is configured
+            turn_tools = tool_router.select(chat_messages) if tool_router else tools
+            start = time.perf_counter()
+            # Run the blocking request in a thread so concurrent conversations keep running
+            result = await asyncio.to_thread(
+                llm_client.chat.completions.create,
                 model="llama-3.3-70b-versatile",
                 messages=chat_messages,
-                tools=tools if tools else None,
+                tools=turn_tools if turn_tools else None,
+            )
+            logger.info(
+                f"Completion took {time.perf_counter() - start:.2f}s with {len(turn_tools or [])} tools"
             )
 
             if result.choices[0].finish_reason == "tool_calls":
                 chat_messages.append(result.choices[0].message)
+                turn_messages = [to_jsonable(result.choices[0].message)]
 
                 for tool_call in result.choices[0].message.tool_calls:
                     tool_name = tool_call.function.name
@@ -144,41 +402,68 @@ async def chat(
 
                     # Log tool call
                     log_message = f"**Tool Call**  \n**Tool Name:** `{tool_name}` from **MCP Server**: `{server_name}`  \n**Input:**  \n```json\n{json.dumps(tool_args, indent=2)}\n```"
-                    yield {"role": "assistant", "content": log_message}
+                    yield {"role": "assistant", "type": "tool_call", "content": log_message}
 
                     # Call the tool and log its observation
                     observation = await connection_manager.call_tool(
                         tool_name, tool_args, tool_map
                     )
                     log_message = f"**Tool Observation**  \n**Tool Name:** `{tool_name}` from **MCP Server**: `{server_name}`  \n**Output:**  \n```json\n{json.dumps(observation, indent=2)}\n```  \n---"
-                    yield {"role": "assistant", "content": log_message}
-
-                    chat_messages.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": str(observation),
-                        }
-                    )
+                    yield {"role": "assistant", "type": "tool_observation", "content": log_message}
+
+                    tool_message = {
+                        "role": "tool",
+                        "tool_call_id": tool_call.id,
+                        "content": str(observation),
+                    }
+                    chat_messages.append(tool_message)
+                    turn_messages.append(tool_message)
+
+                # Only complete tool-call turns go into the transcript
+                if transcript is not None:
+                    transcript.extend(turn_messages)
             else:
-                yield {"role": "assistant", "content": result.choices[0].message.content}
+                content = result.choices[0].message.content
+                if transcript is not None:
+                    transcript.append({"role": "assistant", "content": content})
+                yield {"role": "assistant", "type": "answer", "content": content}
                 return
         except Exception as e:
             error_msg = f"Error during chat processing: {str(e)}"
             logger.error(error_msg)
-            yield {"role": "assistant", "content": f"Sorry, I encountered an error: {str(e)}"}
+            yield {"role": "assistant", "type": "error", "content": f"Sorry, I encountered an error: {str(e)}"}
             return
 
     # Generate a final response if max turns are reached
     try:
-        result = client.chat.completions.create(
+        result = await asyncio.to_thread(
+            llm_client.chat.completions.create,
             model="llama-3.3-70b-versatile",
             messages=chat_messages,
         )
-        yield {"role": "assistant", "content": result.choices[0].message.content}
+        content = result.choices[0].message.content
+        if transcript is not None:
+            transcript.append({"role": "assistant", "content": content})
+        yield {"role": "assistant", "type": "answer", "content": content}
     except Exception as e:
         logger.error(f"Error generating final response: {e}")
-        yield {"role": "assistant", "content": f"Sorry, I encountered an error in the final response: {str(e)}"}
+        yield {"role": "assistant", "type": "error", "content": f"Sorry, I encountered an error in the final response: {str(e)}"}
+
+
+# Convert MCP tool objects into OpenAI-style tool definitions
+def build_tools_json(tool_objects):
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": tool.name,
+                "description": tool.description,
+                "strict": True,
+                "parameters": filter_input_schema(tool.inputSchema),
+            },
+        }
+        for tool in tool_objects
+    ]
 
 
 # Filter and validate input schema for tools
@@ -232,11 +517,18 @@ if __name__ == "__main__":
 
     async def main():
         try:
-            connection_manager = ConnectionManager(stdio_server_map, sse_server_map)
+            # Tool results are recorded/replayed alongside completions (LLM_RECORD_PATH / LLM_REPLAY_PATH)
+            connection_manager = create_connection_manager(
+                lambda: ConnectionManager(
+                    stdio_server_map,
+                    sse_server_map,
+                    lazy=os.getenv("MCP_LAZY_SERVERS", "0") == "1",
+                )
+            )
             await connection_manager.initialize()
             
             # Check if we have any valid connections
-            if not connection_manager.sessions:
+            if not connection_manager.lazy and not connection_manager.sessions:
                 logger.error("No MCP servers connected. Please check server availability.")
                 return
                 
@@ -245,18 +537,10 @@ if __name__ == "__main__":
             if not tool_objects:
                 logger.warning("No tools available from connected servers.")
 
-            tools_json = [
-                {
-                    "type": "function",
-                    "function": {
-                        "name": tool.name,
-                        "description": tool.description,
-                        "strict": True,
-                        "parameters": filter_input_schema(tool.inputSchema),
-                    },
-                }
-                for tool in tool_objects
-            ]
+            tools_json = build_tools_json(tool_objects)
+            # TOOL_ROUTER_TOP_K=0 sends every tool on every turn
+            top_k = int(os.getenv("TOOL_ROUTER_TOP_K", "5"))
+            tool_router = ToolRouter(tools_json, top_k=top_k) if top_k > 0 else None
 
             query = input("Enter your query: ")
             system_prompt="""You are operating in an agent loop, iteratively completing tasks through these steps:
@@ -280,6 +564,7 @@ if __name__ == "__main__":
                 tool_map,
                 tools=tools_json,
                 connection_manager=connection_manager,
+                tool_router=tool_router,
             ):
                 print("\n------\n")
                 print(f"RESPONSE: {response['role']}")
@@ -295,6 +580,8 @@ if __name__ == "__main__":
                     await connection_manager.close()
             except Exception as e:
                 logger.error(f"Error during cleanup: {e}")
+            if locals().get('tool_router') is not None:
+                logger.info(f"Tool routing stats: {tool_router.stats}")
 
     try:
         asyncio.run(main())
@@ -1,50 +1,184 @@
-import pygame
-import sys
+"""
+Bouncing-ball simulation with a NumPy-vectorized engine.
 
-# Initialize Pygame
-pygame.init()
+Positions and velocities of all balls live in (n, 2) arrays and every step
+moves and bounces all of them at once. The loop uses a fixed timestep, so
+results do not depend on frame rate, and it can run headless (dummy SDL video
+driver) or without pygame at all.
+
+Examples:
+    python3 rolling_ball.py                    # one ball in a window, as before
+    python3 rolling_ball.py --balls 500        # many balls
+    python3 rolling_ball.py --headless --seconds 5
+    python3 rolling_ball.py --benchmark        # steps/s across ball counts
+
+As an `execute_code` load test, send this file's contents followed by a call
+such as `run_benchmark([1000, 100000], steps=500)`.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
 
 # Set up some constants
 WIDTH, HEIGHT = 640, 480
 SPEED = 2
 BALL_RADIUS = 20
-
-# Create the game screen
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
+FPS = 60
 
 # Define some colors
 WHITE = (255, 255, 255)
 RED = (255, 0, 0)
 
-# Set up the ball
-ball_x, ball_y = WIDTH // 2, HEIGHT // 2
-ball_dx, ball_dy = SPEED, SPEED
 
-# Game loop
-while True:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
+class BallSimulation:
+    """
+    Array-backed simulation of n balls bouncing inside a box.
+
+    Velocities are in pixels per second; `step(dt)` advances every ball by
+    `dt` seconds and reflects the ones that crossed a wall.
+    """
+
+    def __init__(self, n_balls=1, width=WIDTH, height=HEIGHT, radius=BALL_RADIUS, speed=SPEED * FPS, seed=0):
+        self.bounds = np.array([width, height], dtype=np.float64)
+        self.radius = radius
+        if n_balls == 1:
+            # The original single ball: centre of the screen, moving diagonally
+            self.positions = self.bounds[None, :] / 2
+            self.velocities = np.full((1, 2), float(speed))
+        else:
+            rng = np.random.default_rng(seed)
+            self.positions = rng.uniform(radius, self.bounds - radius, size=(n_balls, 2))
+            angles = rng.uniform(0, 2 * np.pi, size=n_balls)
+            self.velocities = speed * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        self.low = np.full(2, float(radius))
+        self.high = self.bounds - radius
+
+    def __len__(self):
+        return self.positions.shape[0]
+
+    def step(self, dt):
+        """Advance all balls by `dt` seconds, bouncing them off the walls."""
+        self.positions += self.velocities * dt
+        # Reflect positions that overshot a wall and point velocities back inside
+        below = self.positions < self.low
+        above = self.positions > self.high
+        self.positions = np.where(below, 2 * self.low - self.positions, self.positions)
+        self.positions = np.where(above, 2 * self.high - self.positions, self.positions)
+        self.velocities = np.where(below, np.abs(self.velocities), self.velocities)
+        self.velocities = np.where(above, -np.abs(self.velocities), self.velocities)
+
+
+def run(sim, seconds=None, fps=FPS, render=True, headless=False):
+    """
+    Fixed-timestep loop: physics always advances in 1/fps steps, rendering at most once per frame.
+
+    Args:
+        sim (BallSimulation): The simulation to drive
+        seconds (float): Stop after this much simulated time (None runs until the window closes)
+        fps (int): Physics rate and frame-rate cap
+        render (bool): Draw with pygame
+        headless (bool): Use the dummy SDL video driver (no display needed)
+
+    Returns:
+        int: Number of simulation steps taken
+    """
+    dt = 1.0 / fps
+    steps = 0
+    screen = clock = None
+    if render:
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+        import pygame
+
+        # Initialize Pygame
+        pygame.init()
+        # Create the game screen
+        screen = pygame.display.set_mode((int(sim.bounds[0]), int(sim.bounds[1])))
+        clock = pygame.time.Clock()
+
+    previous = time.perf_counter()
+    accumulator = 0.0
+    try:
+        while seconds is None or steps * dt < seconds:
+            if render:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        return steps
+                now = time.perf_counter()
+                # Headless runs one step per frame; otherwise follow the wall clock,
+                # capping catch-up so a stall does not trigger a burst of steps
+                accumulator += dt if headless else min(now - previous, 0.25)
+                previous = now
+                while accumulator >= dt:
+                    sim.step(dt)
+                    steps += 1
+                    accumulator -= dt
+
+                # Fill the screen with white and draw the balls
+                screen.fill(WHITE)
+                for x, y in sim.positions.astype(int):
+                    pygame.draw.circle(screen, RED, (x, y), sim.radius)
+                pygame.display.flip()
+
+                # Cap the frame rate (headless runs as fast as possible)
+                if not headless:
+                    clock.tick(fps)
+            else:
+                sim.step(dt)
+                steps += 1
+    finally:
+        if render:
             pygame.quit()
-            sys.exit()
+    return steps
+
+
+def run_benchmark(ball_counts=(1, 10, 100, 1_000, 10_000, 100_000), steps=1_000, dt=1.0 / FPS):
+    """
+    Report simulation steps per second for each ball count (no rendering).
+
+    Returns:
+        list: (ball count, steps per second) for each run
+    """
+    results = []
+    print(f"{'balls':>8} {'steps/s':>12} {'ball-steps/s':>14}")
+    for n in ball_counts:
+        sim = BallSimulation(n)
+        sim.step(dt)  # warm-up
+        start = time.perf_counter()
+        for _ in range(steps):
+            sim.step(dt)
+        elapsed = time.perf_counter() - start
+        rate = steps / elapsed
+        results.append((n, rate))
+        print(f"{n:>8} {rate:>12.0f} {rate * n:>14.3g}")
+    return results
+
 
-    # Fill the screen with white
-    screen.fill(WHITE)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bouncing balls with a vectorized engine")
+    parser.add_argument("--balls", type=int, default=1, help="Number of balls")
+    parser.add_argument("--seconds", type=float, default=None, help="Simulated seconds to run (default: until closed)")
+    parser.add_argument("--headless", action="store_true", help="Render with the dummy SDL video driver")
+    parser.add_argument("--no-render", action="store_true", help="Simulate only, without pygame")
+    parser.add_argument("--benchmark", action="store_true", help="Report steps/s across ball counts")
+    parser.add_argument("--steps", type=int, default=1000, help="Benchmark steps per ball count")
+    args = parser.parse_args(argv)
 
-    # Draw the ball
-    pygame.draw.circle(screen, RED, (ball_x, ball_y), BALL_RADIUS)
+    if args.benchmark:
+        run_benchmark(steps=args.steps)
+        return
 
-    # Update the ball position
-    ball_x += ball_dx
-    ball_y += ball_dy
+    if args.seconds is None and (args.headless or args.no_render):
+        parser.error("--seconds is required with --headless or --no-render")
 
-    # Bounce the ball off the edges
-    if ball_x - BALL_RADIUS < 0 or ball_x + BALL_RADIUS > WIDTH:
-        ball_dx *= -1
-    if ball_y - BALL_RADIUS < 0 or ball_y + BALL_RADIUS > HEIGHT:
-        ball_dy *= -1
+    sim = BallSimulation(args.balls)
+    start = time.perf_counter()
+    steps = run(sim, seconds=args.seconds, render=not args.no_render, headless=args.headless)
+    elapsed = time.perf_counter() - start
+    print(f"{steps} steps with {len(sim)} balls in {elapsed:.2f}s ({steps / max(elapsed, 1e-9):.0f} steps/s)")
 
-    # Flip the display
-    pygame.display.flip()
 
-    # Cap the frame rate
-    pygame.time.Clock().tick(60)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import json
+import logging
+import math
+import re
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+_word_re = re.compile(r"[A-Za-z0-9]+")
+_camel_re = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_stopwords = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for", "from",
+    "get", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "please",
+    "the", "this", "to", "what", "with", "you",
+}
+
+
+def tokenize(text):
+    """Lowercase words of `text`, with snake_case and camelCase identifiers split."""
+    tokens = []
+    for word in _word_re.findall(text or ""):
+        for part in _camel_re.findall(word) or [word]:
+            part = part.lower()
+            if part not in _stopwords:
+                tokens.append(part)
+    return tokens
+
+
+def count_tokens(text):
+    """Approximate prompt tokens of `text` (tiktoken when available, else chars / 4)."""
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except Exception:
+        return max(1, len(text) // 4)
+
+
+def tool_text(tool):
+    """Searchable text of an OpenAI-style tool definition: name, description and parameters."""
+    function = tool["function"]
+    parts = [function["name"], function.get("description") or ""]
+    for name, schema in function.get("parameters", {}).get("properties", {}).items():
+        parts.append(name)
+        if isinstance(schema, dict):
+            parts.append(schema.get("description", ""))
+    return " ".join(parts)
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ToolRouter:
+    """
+    Per-turn tool shortlisting for large tool catalogs.
+
+    Tools are indexed by name, description and parameter schema. For each
+    LLM request only the top-K tools matching the latest user message (plus
+    any tool already used in the conversation) are sent; if nothing matches,
+    the full list is sent. Optional embeddings are fused with the lexical
+    ranking by reciprocal rank.
+
+    Args:
+        tools (list): OpenAI-style tool definitions (`tools_json`)
+        top_k (int): Maximum number of tools to select per turn
+        embed_fn (callable): Optional function mapping a list of texts to vectors
+        min_similarity (float): Cosine similarity an embedding match must reach
+        k1, b (float): BM25 parameters
+    """
+
+    def __init__(self, tools, top_k=5, embed_fn=None, min_similarity=0.3, k1=1.2, b=0.75):
+        self.tools = list(tools)
+        self.top_k = top_k
+        self.embed_fn = embed_fn
+        self.min_similarity = min_similarity
+        self.k1 = k1
+        self.b = b
+        self._names = [tool["function"]["name"] for tool in self.tools]
+        self._docs = [Counter(tokenize(tool_text(tool))) for tool in self.tools]
+        self._lengths = [sum(doc.values()) for doc in self._docs]
+        self._avg_length = sum(self._lengths) / max(1, len(self._lengths))
+        doc_freqs = Counter(term for doc in self._docs for term in doc)
+        n = len(self._docs)
+        self._idf = {term: math.log(1.0 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+        self._tool_vectors = embed_fn([tool_text(tool) for tool in self.tools]) if embed_fn else None
+        self._full_tokens = count_tokens(json.dumps(self.tools)) if self.tools else 0
+        self.stats = {"turns": 0, "fallbacks": 0, "full_tokens": 0, "sent_tokens": 0, "routing_seconds": 0.0}
+
+    def _lexical_scores(self, query):
+        terms = set(tokenize(query))
+        scores = []
+        for doc, length in zip(self._docs, self._lengths):
+            score = 0.0
+            for term in terms:
+                tf = doc.get(term)
+                if tf:
+                    norm = self.k1 * (1.0 - self.b + self.b * length / max(self._avg_length, 1e-9))
+                    score += self._idf[term] * tf * (self.k1 + 1.0) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def rank(self, query):
+        """Return tool indices matching `query`, best first."""
+        lexical = self._lexical_scores(query)
+        ranked = [i for i in sorted(range(len(self.tools)), key=lambda i: -lexical[i]) if lexical[i] > 0]
+        if self._tool_vectors is None:
+            return ranked
+
+        query_vector = self.embed_fn([query])[0]
+        similarity = [_cosine(query_vector, vector) for vector in self._tool_vectors]
+        semantic = [
+            i for i in sorted(range(len(self.tools)), key=lambda i: -similarity[i])[:self.top_k]
+            if similarity[i] >= self.min_similarity
+        ]
+        fused = Counter()
+        for ranking in (ranked, semantic):
+            for rank, i in enumerate(ranking):
+                fused[i] += 1.0 / (60 + rank + 1)
+        return [i for i, _ in fused.most_common()]
+
+    def select(self, messages):
+        """
+        Choose the tools to send with the next completion request.
+
+        Args:
+            messages (list): The conversation so far (dicts or SDK message objects)
+
+        Returns:
+            list: The shortlisted tool definitions, or all tools when nothing matches
+        """
+        start = time.perf_counter()
+        query, used = "", set()
+        for message in messages:
+            role = message["role"] if isinstance(message, dict) else getattr(message, "role", None)
+            if role == "user":
+                query = message["content"] if isinstance(message, dict) else message.content
+            tool_calls = message.get("tool_calls") if isinstance(message, dict) else getattr(message, "tool_calls", None)
+            for tool_call in tool_calls or []:
+                function = tool_call["function"] if isinstance(tool_call, dict) else tool_call.function
+                used.add(function["name"] if isinstance(function, dict) else function.name)
+
+        ranked = self.rank(query if isinstance(query, str) else json.dumps(query))
+        if not ranked:
+            selected = self.tools
+            self.stats["fallbacks"] += 1
+        else:
+            chosen = set(ranked[:self.top_k])
+            chosen.update(i for i, name in enumerate(self._names) if name in used)
+            selected = [tool for i, tool in enumerate(self.tools) if i in chosen]
+
+        sent_tokens = count_tokens(json.dumps(selected)) if selected is not self.tools else self._full_tokens
+        self.stats["turns"] += 1
+        self.stats["full_tokens"] += self._full_tokens
+        self.stats["sent_tokens"] += sent_tokens
+        self.stats["routing_seconds"] += time.perf_counter() - start
+        logger.info(
+            f"Tool routing: sending {len(selected)}/{len(self.tools)} tools "
+            f"(~{sent_tokens}/{self._full_tokens} schema tokens)"
+        )
+        return selected
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+
+    parser = argparse.ArgumentParser(description="Benchmark per-turn tool shortlisting")
+    parser.add_argument("--servers", type=int, default=30, help="Number of simulated MCP servers")
+    parser.add_argument("--tools-per-server", type=int, default=6, help="Tools per server")
+    parser.add_argument("--top-k", type=int, default=5, help="Tools selected per turn")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    domains = ["weather", "calendar", "github", "slack", "jira", "database", "email", "files",
+               "browser", "maps", "stocks", "translate", "python", "time", "docs", "music"]
+    verbs = ["get", "list", "create", "update", "delete", "search", "run", "send"]
+    tools = []
+    for s in range(args.servers):
+        domain = domains[s % len(domains)]
+        for t in range(args.tools_per_server):
+            verb = verbs[t % len(verbs)]
+            tools.append({
+                "type": "function",
+                "function": {
+                    "name": f"{verb}_{domain}_item_{s}",
+                    "description": f"{verb.title()} {domain} records on server {s}. " * 3,
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "query": {"type": "string", "description": f"The {domain} query"},
+                            "limit": {"type": "integer", "description": "Maximum results"},
+                        },
+                    },
+                },
+            })
+
+    router = ToolRouter(tools, top_k=args.top_k)
+    queries = [f"please {rng.choice(verbs)} the {rng.choice(domains)} entries" for _ in range(200)]
+    queries += ["tell me a joke"] * 10
+    for query in queries:
+        router.select([{"role": "user", "content": query}])
+
+    stats = router.stats
+    saved = 1 - stats["sent_tokens"] / max(1, stats["full_tokens"])
+    print(f"catalog: {len(tools)} tools, ~{router._full_tokens} schema tokens per request")
+    print(f"turns: {stats['turns']}, fallbacks to full list: {stats['fallbacks']}")
+    print(f"schema tokens sent: {stats['sent_tokens']} of {stats['full_tokens']} ({saved:.1%} saved)")
+    print(f"routing overhead: {stats['routing_seconds'] * 1000 / stats['turns']:.3f}ms/turn")
@@ -0,0 +1,318 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; fall back to zlib
+    zstandard = None
+
+HEADER_FILE = "corpus.json"
+DATA_FILE = "corpus.bin"
+INDEX_FILE = "corpus.idx"
+SOURCES_FILE = "corpus_sources.txt"
+
+# One fixed-size index record per document: (frame offset, frame length)
+_RECORD = struct.Struct("<QI")
+
+LLMS_FULL_SEPARATOR = "=" * 80
+
+
+def _compressor(codec, level):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("The 'zstandard' package is required for zstd corpora")
+        return zstandard.ZstdCompressor(level=level).compress
+    if codec == "zlib":
+        return lambda data: zlib.compress(data, level)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def _decompressor(codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("The 'zstandard' package is required for zstd corpora")
+        return zstandard.ZstdDecompressor().decompress
+    if codec == "zlib":
+        return zlib.decompress
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+class CorpusWriter:
+    """
+    Append documents to a random-access, compressed corpus.
+
+    On-disk layout (one directory per corpus):
+        corpus.json          codec and format version
+        corpus.bin           concatenated compressed frames, one per document
+        corpus.idx           fixed-size (offset, length) record per document ID
+        corpus_sources.txt   source URL of each document, one per line
+
+    Opening an existing corpus appends to it, so documents can be added
+    incrementally across runs; `append(..., skip_existing=True)` leaves sources
+    that are already indexed alone. With `overwrite=True` a fresh corpus is
+    written next to the old one and swapped in on a clean close, so readers
+    never see a half-written corpus and stale copies do not pile up.
+
+    The index record is written last and is the commit point of an append:
+    an interrupted write never exposes a partial document, and on open any
+    trailing frame bytes or source lines without an index record are trimmed
+    (missing source lines are restored from their frames).
+    """
+
+    def __init__(self, path, codec=None, level=None, overwrite=False):
+        self.path = path
+        self._write_path = path + ".new" if overwrite else path
+        if overwrite and os.path.exists(self._write_path):
+            shutil.rmtree(self._write_path)
+        os.makedirs(self._write_path, exist_ok=True)
+        header_path = os.path.join(self._write_path, HEADER_FILE)
+        if os.path.exists(header_path):
+            with open(header_path) as f:
+                self.codec = json.load(f)["codec"]
+        else:
+            self.codec = codec or ("zstd" if zstandard is not None else "zlib")
+            with open(header_path, "w") as f:
+                json.dump({"version": 1, "codec": self.codec}, f)
+        if level is None:
+            level = 10 if self.codec == "zstd" else 6
+        self._compress = _compressor(self.codec, level)
+        self._reconcile()
+        self.sources = {}
+        sources_path = os.path.join(self._write_path, SOURCES_FILE)
+        if os.path.exists(sources_path):
+            with open(sources_path, encoding="utf-8") as f:
+                for doc_id, line in enumerate(f):
+                    self.sources.setdefault(line.rstrip("\n"), doc_id)
+        self._data = open(os.path.join(self._write_path, DATA_FILE), "ab")
+        self._index = open(os.path.join(self._write_path, INDEX_FILE), "ab")
+        self._sources = open(sources_path, "a", encoding="utf-8")
+        self.count = self._index.tell() // _RECORD.size
+
+    def _reconcile(self):
+        """Trim or repair the data and sources files to match the committed index records."""
+        index_path = os.path.join(self._write_path, INDEX_FILE)
+        data_path = os.path.join(self._write_path, DATA_FILE)
+        sources_path = os.path.join(self._write_path, SOURCES_FILE)
+        for name in (index_path, data_path, sources_path):
+            open(name, "ab").close()
+
+        with open(index_path, "r+b") as f:
+            index = f.read()
+            count = len(index) // _RECORD.size
+            f.truncate(count * _RECORD.size)
+        data_end = 0
+        if count:
+            offset, length = _RECORD.unpack_from(index, (count - 1) * _RECORD.size)
+            data_end = offset + length
+        with open(data_path, "r+b") as f:
+            f.truncate(data_end)
+
+        with open(sources_path, "r+b") as f:
+            lines = f.read().split(b"\n")[:-1]
+            if len(lines) == count:
+                return
+            decompress = _decompressor(self.codec)
+            with open(data_path, "rb") as data:
+                for doc_id in range(len(lines), count):
+                    offset, length = _RECORD.unpack_from(index, doc_id * _RECORD.size)
+                    data.seek(offset)
+                    record = json.loads(decompress(data.read(length)))
+                    lines.append(record["source"].encode("utf-8"))
+            f.seek(0)
+            f.write(b"".join(line + b"\n" for line in lines[:count]))
+            f.truncate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(discard=exc_type is not None)
+
+    def append(self, content, source="Unknown URL", metadata=None, skip_existing=False):
+        """
+        Append one document and return its ID.
+
+        Args:
+            content (str): Document text
+            source (str): Source URL of the document
+            metadata (dict): Optional extra metadata stored with the document
+            skip_existing (bool): If the source is already indexed, write nothing
+                and return the existing ID (documents without a source are
+                always appended)
+
+        Returns:
+            int: The document's ID
+        """
+        source = source.replace("\n", " ")
+        if skip_existing and source != "Unknown URL" and source in self.sources:
+            return self.sources[source]
+        record = {"source": source, "metadata": metadata or {}, "content": content}
+        frame = self._compress(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+        offset = self._data.tell()
+        self._data.write(frame)
+        self._data.flush()
+        # Sources are one per line, so URLs were made single-line above
+        self._sources.write(source + "\n")
+        self._sources.flush()
+        # The index record commits the document
+        self._index.write(_RECORD.pack(offset, len(frame)))
+        self._index.flush()
+        doc_id = self.count
+        self.sources.setdefault(source, doc_id)
+        self.count += 1
+        return doc_id
+
+    def close(self, discard=False):
+        """
+        Close the files; an overwriting writer swaps its corpus in (or drops it if `discard`).
+        """
+        for f in (self._data, self._index, self._sources):
+            f.close()
+        if self._write_path == self.path:
+            return
+        if discard:
+            shutil.rmtree(self._write_path)
+            return
+        old_path = self.path + ".old"
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+        if os.path.exists(self.path):
+            os.rename(self.path, old_path)
+        os.rename(self._write_path, self.path)
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+        self._write_path = self.path
+
+
+class CorpusReader:
+    """
+    Random-access reader for a corpus written by `CorpusWriter`.
+
+    The data and index files are memory-mapped, so reading one document is
+    a fixed-size index lookup plus one frame decompression.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            self.codec = json.load(f)["codec"]
+        self._decompress = _decompressor(self.codec)
+        self._data = self._index = None
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _map(path):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def refresh(self):
+        """Re-map the files to pick up documents appended since opening."""
+        self.close()
+        self._data = self._map(os.path.join(self.path, DATA_FILE))
+        self._index = self._map(os.path.join(self.path, INDEX_FILE))
+        self.count = len(self._index) // _RECORD.size
+        self._by_source = {}
+        with open(os.path.join(self.path, SOURCES_FILE), encoding="utf-8") as f:
+            for doc_id, line in enumerate(f):
+                if doc_id >= self.count:
+                    break
+                self._by_source.setdefault(line.rstrip("\n"), doc_id)
+
+    def close(self):
+        for mapped in (self._data, self._index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for doc_id in range(self.count):
+            yield self.get(doc_id)
+
+    def get(self, doc_id):
+        """Return the document ({"id", "source", "metadata", "content"}) with the given ID."""
+        if not 0 <= doc_id < self.count:
+            raise IndexError(f"Document {doc_id} out of range")
+        offset, length = _RECORD.unpack_from(self._index, doc_id * _RECORD.size)
+        record = json.loads(self._decompress(self._data[offset:offset + length]))
+        record["id"] = doc_id
+        return record
+
+    def get_by_source(self, source):
+        """Return the first document with the given source URL, or None."""
+        doc_id = self._by_source.get(source)
+        return None if doc_id is None else self.get(doc_id)
+
+
+def iter_llms_full(path):
+    """
+    Stream (source, content) pairs from a legacy llms_full.txt file.
+
+    The legacy format is, per document:
+        DOCUMENT n / SOURCE: url / CONTENT: / text / blank / '=' * 80 / blank
+    """
+    source, lines, in_content = None, [], False
+    with open(path, encoding="utf-8") as f:
+        for raw in f:
+            line = raw.rstrip("\n")
+            if not in_content:
+                if line.startswith("SOURCE: "):
+                    source = line[len("SOURCE: "):]
+                elif line == "CONTENT:":
+                    in_content, lines = True, []
+                continue
+            if line == LLMS_FULL_SEPARATOR and lines and lines[-1] == "":
+                yield source, "\n".join(lines[:-1])
+                source, in_content = None, False
+            else:
+                lines.append(line)
+    if in_content:
+        yield source, "\n".join(lines).rstrip("\n")
+
+
+def convert_llms_full(txt_path, corpus_path, codec=None):
+    """
+    Convert a legacy llms_full.txt file into the corpus format in one streaming pass.
+
+    Sources already in the corpus are skipped, so converting twice is harmless.
+
+    Returns:
+        int: Number of documents added
+    """
+    with CorpusWriter(corpus_path, codec=codec) as writer:
+        start = writer.count
+        for source, content in iter_llms_full(txt_path):
+            writer.append(content, source or "Unknown URL", skip_existing=True)
+        return writer.count - start
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert llms_full.txt into the compressed corpus format")
+    parser.add_argument("txt_path", help="Path to a legacy llms_full.txt file")
+    parser.add_argument("corpus_path", help="Output corpus directory")
+    parser.add_argument("--codec", default=None, help="zstd (default if installed) or zlib")
+    args = parser.parse_args()
+
+    converted = convert_llms_full(args.txt_path, args.corpus_path, codec=args.codec)
+    original = os.path.getsize(args.txt_path)
+    compressed = sum(
+        os.path.getsize(os.path.join(args.corpus_path, name))
+        for name in (DATA_FILE, INDEX_FILE, SOURCES_FILE)
+    )
+    print(f"Converted {converted} documents into {args.corpus_path}")
+    print(f"Size: {original} -> {compressed} bytes ({compressed / max(original, 1):.1%})")
@@ -1,13 +1,16 @@
-import re, os
+import re, os, shutil
 import tiktoken
 
 from bs4 import BeautifulSoup
 
 from langchain_community.document_loaders import RecursiveUrlLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_anthropic import ChatAnthropic
-from langchain_community.vectorstores import SKLearnVectorStore
+
+from .embeddingPipeline import create_embeddings
+from .vectorIndex import VectorIndex, replace_directory
+from .lexicalIndex import LexicalIndex
+from .corpusStore import CorpusWriter
 
 def count_tokens(text, model="cl100k_base"):
     """
@@ -90,26 +93,31 @@ def load_langgraph_docs(urls):
     
     return docs, tokens_per_doc
 
-def save_llms_full(documents):
-    """ Save the documents to a file """
-
-    # Open the output file
-    output_filename = "llms_full.txt"
-
-    with open(output_filename, "w") as f:
-        # Write each document
-        for i, doc in enumerate(documents):
+def save_llms_full(documents, output_path="llms_full"):
+    """
+    Save the documents to a compressed, random-access corpus.
+    
+    Each document is compressed into its own frame and indexed by document ID
+    and source URL, so single documents can be read back without scanning the
+    file. An existing corpus is replaced: the new one is written alongside it
+    and swapped in once complete, so re-crawled pages are not duplicated.
+    
+    Args:
+        documents (list): List of Document objects to save
+        output_path (str): Corpus directory (default: llms_full)
+        
+    Returns:
+        int: Number of documents in the corpus
+    """
+    with CorpusWriter(output_path, overwrite=True) as writer:
+        for doc in documents:
             # Get the source (URL) from metadata
             source = doc.metadata.get('source', 'Unknown URL')
-            
-            # Write the document with proper formatting
-            f.write(f"DOCUMENT {i+1}\n")
-            f.write(f"SOURCE: {source}\n")
-            f.write("CONTENT:\n")
-            f.write(doc.page_content)
-            f.write("\n\n" + "="*80 + "\n\n")
+            writer.append(doc.page_content, source, metadata=doc.metadata)
+        count = writer.count
 
-    print(f"Documents concatenated into {output_filename}")
+    print(f"Documents saved to corpus {output_path} ({count} documents)")
+    return count
 
 def split_documents(documents):
     """
@@ -150,48 +158,96 @@ def split_documents(documents):
     
     return split_docs
 
-def create_vectorstore(splits):
+def create_vectorstore(splits, embeddings=None, dtype="float32", ann="ivf"):
     """
-    Create a vector store from document chunks using SKLearnVectorStore.
+    Create a memory-mapped vector index from document chunks.
     
     This function:
-    1. Initializes an embedding model to convert text into vector representations
-    2. Creates a vector store from the document chunks
+    1. Initializes a batched, cached embedding stage to convert text into vector representations
+    2. Writes the vectors, chunk text and metadata as a VectorIndex directory
+    3. Builds a BM25 inverted index over the same chunks in that directory
     
     Args:
         splits (list): List of split Document objects to embed
+        embeddings (CachedEmbeddings): Embedding stage to use (default: OpenAI
+            text-embedding-3-large with an on-disk cache in the working directory)
+        dtype (str): Storage dtype for the vector matrix ("float32" or "float16")
+        ann (str): Approximate nearest-neighbour structure ("ivf", "hnsw" or None)
         
     Returns:
-        SKLearnVectorStore: A vector store containing the embedded documents
+        VectorIndex: A vector index containing the embedded documents
     """
-    print("Creating SKLearnVectorStore...")
-    
-    # Initialize OpenAI embeddings
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-    
-    # Create vector store from documents using SKLearn
-    persist_path = os.getcwd()+"/sklearn_vectorstore.parquet"
-    vectorstore = SKLearnVectorStore.from_documents(
-        documents=splits,
-        embedding=embeddings,
-        persist_path=persist_path   ,
-        serializer="parquet",
+    print("Creating VectorIndex...")
+    
+    # Initialize embeddings; vectors are cached by (model, chunk hash) across runs
+    if embeddings is None:
+        embeddings = create_embeddings("openai", model="text-embedding-3-large")
+    
+    texts = [doc.page_content for doc in splits]
+    vectors = embeddings.embed_documents(texts)
+    print(f"Embedding stats: {embeddings.stats}")
+    
+    # Persist as a contiguous matrix plus metadata/offset files. Both indexes
+    # are written to a staging directory and renamed into place together, so a
+    # docs server reading the previous index is never handed truncated files.
+    persist_path = os.getcwd()+"/vector_index"
+    staging_path = persist_path + ".new"
+    if os.path.exists(staging_path):
+        shutil.rmtree(staging_path)
+    VectorIndex.build(
+        staging_path,
+        vectors,
+        texts,
+        metadatas=[doc.metadata for doc in splits],
+        model=embeddings.model,
+        dtype=dtype,
+        ann=ann,
+        swap=False,
+    ).close()
+
+    # Lexical index for identifier queries and the hybrid prefilter
+    LexicalIndex.build(staging_path, texts)
+
+    replace_directory(staging_path, persist_path)
+    print("VectorIndex and LexicalIndex were persisted to", persist_path)
+
+    return VectorIndex.load(persist_path)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Crawl documentation and build the search index")
+    parser.add_argument(
+        "--urls",
+        nargs="+",
+        default=[
+            "https://langchain-ai.github.io/langgraph/concepts/",
+            "https://langchain-ai.github.io/langgraph/how-tos/",
+            "https://langchain-ai.github.io/langgraph/tutorials/workflows/",
+            "https://langchain-ai.github.io/langgraph/tutorials/introduction/",
+            "https://langchain-ai.github.io/langgraph/tutorials/langgraph-platform/local-server/",
+        ],
+        help="Root URLs to crawl",
+    )
+    parser.add_argument("--embedding-backend", default="openai", help="Embedding backend (openai or local)")
+    parser.add_argument("--dtype", default="float32", help="Vector storage dtype (float32 or float16)")
+    parser.add_argument("--ann", default="ivf", help="ANN index type (ivf, hnsw or none)")
+    args = parser.parse_args()
+
+    # Load the documents
+    documents, tokens_per_doc = load_langgraph_docs(args.urls)
+
+    # Save the documents to a file
+    save_llms_full(documents)
+
+    # Split the documents
+    split_docs = split_documents(documents)
+
+    # Create the vector store
+    model = "text-embedding-3-large" if args.embedding_backend == "openai" else None
+    vectorstore = create_vectorstore(
+        split_docs,
+        embeddings=create_embeddings(args.embedding_backend, model=model),
+        dtype=args.dtype,
+        ann=None if args.ann == "none" else args.ann,
     )
-    print("SKLearnVectorStore created successfully.")
-    
-    vectorstore.persist()
-    print("SKLearnVectorStore was persisted to", persist_path)
-
-    return vectorstore
-
-# Load the documents
-documents, tokens_per_doc = load_langgraph_docs()
-
-# Save the documents to a file
-save_llms_full(documents)
-
-# Split the documents
-split_docs = split_documents(documents)
-
-# Create the vector store
-vectorstore = create_vectorstore(split_docs)
\ No newline at end of file
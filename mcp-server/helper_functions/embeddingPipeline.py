@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+
+def content_hash(text):
+    """
+    Return a stable hash of a chunk's content, used as the embedding cache key.
+
+    Args:
+        text (str): Chunk text
+
+    Returns:
+        str: Hex encoded sha256 of the UTF-8 text
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class OpenAIEmbeddingBackend:
+    """
+    Embedding backend that calls the OpenAI embeddings endpoint.
+
+    Token counts use tiktoken so batches respect the per-request token limit.
+    """
+
+    def __init__(self, model="text-embedding-3-large", encoding="cl100k_base"):
+        self.model = model
+        self.encoding = encoding
+        self._encoder = None
+        self._client = None
+
+    def count_tokens(self, text):
+        if self._encoder is None:
+            import tiktoken
+            self._encoder = tiktoken.get_encoding(self.encoding)
+        return len(self._encoder.encode(text))
+
+    async def embed(self, texts):
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI()
+        response = await self._client.embeddings.create(model=self.model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+
+class LocalHashEmbeddingBackend:
+    """
+    Deterministic, offline embedding backend.
+
+    Tokens are hashed into a fixed number of signed buckets (the "hashing
+    trick") and the result is L2-normalised. Identical text always yields the
+    identical vector, so the whole pipeline can be tested and benchmarked
+    without network access.
+    """
+
+    _token_re = re.compile(r"\w+")
+
+    def __init__(self, dim=256, model=None):
+        self.dim = dim
+        self.model = model or f"local-hash-{dim}"
+
+    def count_tokens(self, text):
+        return len(self._token_re.findall(text))
+
+    def embed_one(self, text):
+        vector = [0.0] * self.dim
+        for token in self._token_re.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value & 1 else -1.0
+            vector[(value >> 1) % self.dim] += sign
+        norm = math.sqrt(sum(v * v for v in vector))
+        if norm:
+            vector = [v / norm for v in vector]
+        return vector
+
+    async def embed(self, texts):
+        return [self.embed_one(text) for text in texts]
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache.
+
+    Vectors are stored as float32 blobs in a SQLite file keyed by
+    (model, content hash), so identical chunks are embedded once across runs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model, hashes):
+        """Return a dict of hash -> vector for the hashes present in the cache."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *chunk],
+                )
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, model, items):
+        """Store an iterable of (hash, vector) pairs."""
+        rows = [(model, key, array("f", vector).tobytes()) for key, vector in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RateLimiter:
+    """Space request start times so at most `requests_per_minute` are issued."""
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def batch_by_tokens(texts, count_tokens, max_batch_tokens=100_000, max_batch_size=256):
+    """
+    Group texts into batches bounded by total tokens and number of items.
+
+    Args:
+        texts (list): Texts to batch
+        count_tokens (callable): Function returning the token count of a text
+        max_batch_tokens (int): Upper bound on the summed tokens of a batch
+        max_batch_size (int): Upper bound on the number of texts in a batch
+
+    Returns:
+        list: A list of batches, each a list of indices into `texts`
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (current_tokens + tokens > max_batch_tokens or len(current) >= max_batch_size):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def is_retryable(error):
+    """
+    Whether an embedding request error is worth retrying.
+
+    Rate limits (429), server errors (5xx), timeouts and connection errors are
+    transient; other errors such as 4xx for an over-long input are not.
+    """
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    # openai.APITimeoutError / APIConnectionError carry no status code
+    return type(error).__name__ in ("APITimeoutError", "APIConnectionError")
+
+
+class CachedEmbeddings:
+    """
+    Batched, concurrent, cached embedding stage.
+
+    Exposes the LangChain `Embeddings` interface (`embed_documents` /
+    `embed_query` and their async variants) so it can be passed anywhere an
+    embedding model is expected, e.g. `SKLearnVectorStore.from_documents`.
+
+    Args:
+        backend: Object with `model`, `count_tokens(text)` and async `embed(texts)`
+        cache (EmbeddingCache): Optional persistent cache
+        max_batch_tokens (int): Token budget per embedding request
+        max_batch_size (int): Maximum number of texts per embedding request
+        max_concurrency (int): Maximum number of in-flight requests
+        requests_per_minute (int): Rate limit for requests, 0 disables it
+        max_retries (int): Retries per batch for transient errors, with exponential backoff
+    """
+
+    def __init__(
+        self,
+        backend,
+        cache=None,
+        max_batch_tokens=100_000,
+        max_batch_size=256,
+        max_concurrency=4,
+        requests_per_minute=0,
+        max_retries=5,
+    ):
+        self.backend = backend
+        self.cache = cache
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.stats = {"requested": 0, "cache_hits": 0, "embedded": 0, "requests": 0}
+
+    @property
+    def model(self):
+        return self.backend.model
+
+    async def _embed_batch(self, texts, semaphore, limiter):
+        delay = 1.0
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            async with semaphore:
+                try:
+                    self.stats["requests"] += 1
+                    return await self.backend.embed(texts)
+                except Exception as e:
+                    if attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    print(f"Embedding batch failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+    async def aembed_documents(self, texts):
+        """Embed a list of texts, reusing cached vectors where available."""
+        texts = list(texts)
+        hashes = [content_hash(text) for text in texts]
+        self.stats["requested"] += len(texts)
+
+        vectors = self.cache.get_many(self.model, hashes) if self.cache else {}
+        self.stats["cache_hits"] += sum(1 for h in hashes if h in vectors)
+
+        # Identical chunks within this call are embedded only once as well
+        missing = {}
+        for text, key in zip(texts, hashes):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            keys = list(missing)
+            pending = [missing[k] for k in keys]
+            batches = batch_by_tokens(
+                pending, self.backend.count_tokens, self.max_batch_tokens, self.max_batch_size
+            )
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            limiter = RateLimiter(self.requests_per_minute)
+
+            async def run(batch):
+                result = await self._embed_batch([pending[i] for i in batch], semaphore, limiter)
+                new_items = [(keys[i], vector) for i, vector in zip(batch, result)]
+                if self.cache:
+                    self.cache.put_many(self.model, new_items)
+                vectors.update(new_items)
+
+            await asyncio.gather(*(run(batch) for batch in batches))
+            self.stats["embedded"] += len(missing)
+
+        return [vectors[key] for key in hashes]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts):
+        return asyncio.run(self.aembed_documents(texts))
+
+    def embed_query(self, text):
+        return asyncio.run(self.aembed_query(text))
+
+
+def create_embeddings(backend="openai", model=None, cache_path=None, **kwargs):
+    """
+    Build a `CachedEmbeddings` for the named backend.
+
+    Args:
+        backend (str): "openai" or "local"
+        model (str): Backend model name (local backend: "local-hash-<dim>")
+        cache_path (str): SQLite cache path, defaults to ./embedding_cache.sqlite
+        **kwargs: Forwarded to `CachedEmbeddings`
+
+    Returns:
+        CachedEmbeddings: The configured embedding stage
+    """
+    if backend == "openai":
+        embedder = OpenAIEmbeddingBackend(model or "text-embedding-3-large")
+    elif backend == "local":
+        dim = int(model.rsplit("-", 1)[-1]) if model else 256
+        embedder = LocalHashEmbeddingBackend(dim=dim)
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    if cache_path is None:
+        cache_path = os.getcwd() + "/embedding_cache.sqlite"
+    cache = EmbeddingCache(cache_path) if cache_path else None
+    return CachedEmbeddings(embedder, cache=cache, **kwargs)
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Benchmark the embedding stage")
+    parser.add_argument("--backend", default="local", help="Embedding backend (local or openai)")
+    parser.add_argument("--chunks", type=int, default=2000, help="Number of synthetic chunks")
+    parser.add_argument("--words", type=int, default=400, help="Words per chunk")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    texts = [" ".join(rng.choices(vocabulary, k=args.words)) for _ in range(args.chunks)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        embeddings = create_embeddings(args.backend, cache_path=os.path.join(tmp, "cache.sqlite"))
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            embeddings.embed_documents(texts)
+            elapsed = time.perf_counter() - start
+            print(f"{label}: {len(texts)} chunks in {elapsed:.3f}s ({len(texts) / elapsed:.0f} chunks/s)")
+        print(f"stats: {embeddings.stats}")
+        embeddings.cache.close()
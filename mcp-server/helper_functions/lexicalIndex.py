@@ -0,0 +1,289 @@
+import json
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+TERMS_FILE = "lexical_terms.json"
+POSTINGS_FILE = "lexical_postings.npz"
+
+_word_re = re.compile(r"[A-Za-z0-9_]+")
+_camel_re = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+@lru_cache(maxsize=200_000)
+def _word_terms(word):
+    lower = word.lower()
+    parts = [p.lower() for piece in word.split("_") for p in _camel_re.findall(piece)]
+    return (lower, *parts) if len(parts) > 1 else (lower,)
+
+
+def tokenize(text):
+    """
+    Split text into lowercase search terms.
+
+    Identifiers are kept whole (`add_conditional_edges`, `stategraph`) and are
+    also split on underscores and camelCase boundaries, so both exact API names
+    and their parts can be matched.
+    """
+    tokens = []
+    for word in _word_re.findall(text):
+        tokens.extend(_word_terms(word))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index stored next to a VectorIndex.
+
+    On-disk layout:
+        lexical_terms.json     sorted vocabulary and BM25 parameters
+        lexical_postings.npz   per-term posting offsets, doc ids, term
+                               frequencies and document lengths
+    """
+
+    def __init__(self, terms, term_offsets, doc_ids, term_freqs, doc_lengths, k1=1.5, b=0.75):
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.term_offsets = term_offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        n = len(doc_lengths)
+        self.avg_length = float(doc_lengths.mean()) if n else 0.0
+        doc_freqs = np.diff(term_offsets)
+        self.idf = np.log(1.0 + (n - doc_freqs + 0.5) / (doc_freqs + 0.5))
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, path, texts, k1=1.5, b=0.75):
+        """
+        Build the inverted index for `texts` (row i = text i) and write it to `path`.
+
+        Returns:
+            LexicalIndex: The freshly written index
+        """
+        os.makedirs(path, exist_ok=True)
+        postings = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[row] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((row, tf))
+
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            term_offsets[i + 1] = term_offsets[i] + len(postings[term])
+        doc_ids = np.empty(term_offsets[-1], dtype=np.int32)
+        term_freqs = np.empty(term_offsets[-1], dtype=np.float32)
+        for i, term in enumerate(terms):
+            rows, tfs = zip(*postings[term])
+            doc_ids[term_offsets[i]:term_offsets[i + 1]] = rows
+            term_freqs[term_offsets[i]:term_offsets[i + 1]] = tfs
+
+        with open(os.path.join(path, TERMS_FILE), "w") as f:
+            json.dump({"k1": k1, "b": b, "terms": terms}, f)
+        np.savez(
+            os.path.join(path, POSTINGS_FILE),
+            term_offsets=term_offsets,
+            doc_ids=doc_ids,
+            term_freqs=term_freqs,
+            doc_lengths=doc_lengths,
+        )
+        return cls(terms, term_offsets, doc_ids, term_freqs, doc_lengths, k1=k1, b=b)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index previously written by `build`."""
+        with open(os.path.join(path, TERMS_FILE)) as f:
+            header = json.load(f)
+        with np.load(os.path.join(path, POSTINGS_FILE)) as data:
+            arrays = {key: data[key] for key in data.files}
+        return cls(
+            header["terms"],
+            arrays["term_offsets"],
+            arrays["doc_ids"],
+            arrays["term_freqs"],
+            arrays["doc_lengths"],
+            k1=header["k1"],
+            b=header["b"],
+        )
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, TERMS_FILE))
+
+    def scores(self, query):
+        """Return the BM25 score of every row for `query` as a dense array."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths / max(self.avg_length, 1e-9))
+        for term in set(tokenize(query)):
+            i = self.term_ids.get(term)
+            if i is None:
+                continue
+            start, end = self.term_offsets[i], self.term_offsets[i + 1]
+            rows = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            scores[rows] += self.idf[i] * tf * (self.k1 + 1.0) / (tf + norm[rows])
+        return scores
+
+    def search(self, query, k=5):
+        """Return up to k (row, score) tuples with a positive BM25 score, best first."""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        top = matched[np.argsort(-scores[matched], kind="stable")[:k]]
+        return [(int(row), float(scores[row])) for row in top]
+
+
+def reciprocal_rank_fusion(rankings, k=5, c=60, weights=None):
+    """
+    Combine several ranked lists of (row, score) with reciprocal-rank fusion.
+
+    Args:
+        rankings (list): Ranked lists of (row, score) tuples
+        k (int): Number of fused results to return
+        c (int): RRF damping constant
+        weights (list): Optional weight per ranking (default: all 1.0)
+
+    Returns:
+        list: Up to k (row, fused score) tuples, best first
+    """
+    fused = {}
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        for rank, (row, _) in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + weight / (c + rank + 1)
+    return sorted(fused.items(), key=lambda item: -item[1])[:k]
+
+
+def fuse_hybrid(lexical_hits, vector_hits, k=5, lexical_weight=1.5):
+    """
+    Merge BM25 hits with the vector rescoring of the same candidates by weighted RRF.
+
+    Args:
+        lexical_hits (list): BM25 (row, score) tuples, best first
+        vector_hits (list): Vector (row, score) tuples for the candidates, best first
+        k (int): Number of fused results to return
+        lexical_weight (float): RRF weight of the lexical ranking (the vector
+            ranking has weight 1.0); see the `__main__` benchmark for the tuning
+
+    Returns:
+        list: Up to k (row, fused score) tuples, ordered by fused score
+    """
+    return reciprocal_rank_fusion(
+        [lexical_hits[:k * 4], vector_hits], k=k, weights=[lexical_weight, 1.0]
+    )
+
+
+def hybrid_search(vector_index, lexical_index, query, query_vector, k=5, candidates=200, lexical_weight=1.5):
+    """
+    Lexical prefilter, vector rescoring of the candidates, then weighted RRF.
+
+    Falls back to a full vector search when the query has no lexical match.
+
+    Returns:
+        list: Up to k (row, fused score) tuples, best first
+    """
+    lexical_hits = lexical_index.search(query, candidates)
+    if not lexical_hits:
+        return vector_index.search(query_vector, k)[0]
+    rows = np.sort(np.array([row for row, _ in lexical_hits], dtype=np.int64))
+    vector_hits = vector_index.search_candidates(query_vector, [rows], k=k * 4)[0]
+    return fuse_hybrid(lexical_hits, vector_hits, k=k, lexical_weight=lexical_weight)
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import tempfile
+    import time
+
+    from .embeddingPipeline import create_embeddings
+    from .vectorIndex import VectorIndex
+
+    parser = argparse.ArgumentParser(description="Benchmark lexical, vector and hybrid retrieval")
+    parser.add_argument("--chunks", type=int, default=20_000, help="Number of synthetic chunks")
+    parser.add_argument("--words", type=int, default=300, help="Words per chunk")
+    parser.add_argument("--queries", type=int, default=200, help="Number of identifiers (two queries each)")
+    parser.add_argument("--k", type=int, default=5, help="Results per query")
+    parser.add_argument(
+        "--vectors", default="topic", choices=["topic", "local"],
+        help="topic: synthetic vectors that carry real signal; local: the offline hash embedder",
+    )
+    parser.add_argument("--vector-noise", type=float, default=2.0, help="Query noise for topic vectors")
+    parser.add_argument("--lexical-weights", type=float, nargs="+", default=[1.0, 1.5, 2.0], help="Hybrid weights to compare")
+    args = parser.parse_args()
+
+    # Synthetic corpus: each identifier is planted in a handful of chunks. Every
+    # identifier is queried twice: verbatim, where BM25 is nearly exact, and
+    # paraphrased as loose words, where BM25 alone is ambiguous.
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    identifiers = [f"{rng.choice(['add', 'get', 'set', 'build'])}_node_{i}" for i in range(args.queries)]
+    texts = [rng.choices(vocabulary, k=args.words) for _ in range(args.chunks)]
+    relevant = {}
+    for ident in identifiers:
+        for row in rng.sample(range(args.chunks), 3):
+            texts[row][rng.randrange(args.words)] = ident
+            relevant.setdefault(ident, set()).add(row)
+    texts = [" ".join(words) for words in texts]
+    queries = {
+        "identifier": [f"how do I call {ident}" for ident in identifiers],
+        "paraphrase": [f"{ident.split('_')[0]} a node {ident.rsplit('_', 1)[1]}" for ident in identifiers],
+    }
+
+    if args.vectors == "topic":
+        # Chunks about the same identifier share a topic direction; queries are
+        # noisy copies of it, so the vector stage is informative but imperfect
+        np_rng = np.random.default_rng(0)
+        dim = 64
+        topics = {ident: np_rng.standard_normal(dim) for ident in identifiers}
+        doc_vectors = np_rng.standard_normal((args.chunks, dim))
+        for ident, rows in relevant.items():
+            for row in rows:
+                doc_vectors[row] = 2.0 * topics[ident] + np_rng.standard_normal(dim)
+        query_vectors = {
+            style: [topics[ident] + args.vector_noise * np_rng.standard_normal(dim) for ident in identifiers]
+            for style in queries
+        }
+        model = "synthetic-topic"
+    else:
+        embeddings = create_embeddings("local", cache_path="")
+        doc_vectors = embeddings.embed_documents(texts)
+        query_vectors = {style: embeddings.embed_documents(qs) for style, qs in queries.items()}
+        model = embeddings.model
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vector_index = VectorIndex.build(tmp, doc_vectors, texts, model=model)
+        start = time.perf_counter()
+        lexical_index = LexicalIndex.build(tmp, texts)
+        print(f"lexical build: {time.perf_counter() - start:.2f}s")
+
+        modes = {
+            "lexical": lambda q, v: lexical_index.search(q, args.k),
+            "vector": lambda q, v: vector_index.search(v, args.k, exact=True)[0],
+        }
+        for weight in args.lexical_weights:
+            modes[f"hybrid w={weight:g}"] = (
+                lambda q, v, w=weight: hybrid_search(vector_index, lexical_index, q, v, args.k, lexical_weight=w)
+            )
+        for style, style_queries in queries.items():
+            print(f"{style} queries:")
+            for mode, run in modes.items():
+                hits = 0
+                start = time.perf_counter()
+                for ident, query, vector in zip(identifiers, style_queries, query_vectors[style]):
+                    hits += sum(1 for row, _ in run(query, vector) if row in relevant[ident])
+                elapsed = time.perf_counter() - start
+                recall = hits / (len(identifiers) * min(args.k, 3))
+                print(f"  {mode:>12}: {elapsed * 1000 / len(identifiers):.2f}ms/query, recall@{args.k}: {recall:.3f}")
+        print("(query embedding time excluded; lexical mode needs no embedding call)")
+        vector_index.close()
@@ -0,0 +1,377 @@
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+METADATA_FILE = "metadata.jsonl"
+OFFSETS_FILE = "metadata_offsets.npy"
+IVF_FILE = "ivf.npz"
+IVF_VECTORS_FILE = "ivf_vectors.npy"
+HNSW_FILE = "hnsw.bin"
+
+
+def replace_directory(staging, path):
+    """
+    Swap a fully written `staging` directory in for `path` using renames.
+
+    Files are never truncated in place, so a process that has the old index
+    memory-mapped keeps reading the old (unlinked) files until it reloads.
+    """
+    old_path = path + ".old"
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(staging, path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.size == 0:
+        return matrix.reshape(0, matrix.shape[1] if matrix.ndim == 2 else 0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores, k):
+    """Return (indices, scores) of the k largest entries per row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+def _kmeans(vectors, nlist, iterations=10, sample_size=50_000, seed=0):
+    """Spherical k-means on a sample of the rows; returns unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    sample = vectors[np.sort(rng.choice(n, size=min(n, sample_size), replace=False))]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = sample[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class VectorIndex:
+    """
+    Memory-mapped vector index with optional approximate nearest-neighbour search.
+
+    On-disk layout (one directory per index):
+        manifest.json          model, dimension, dtype, row count, ANN type and build ID
+        vectors.npy            contiguous float32/float16 matrix of unit vectors
+        metadata.jsonl         one JSON record (text + metadata) per row
+        metadata_offsets.npy   byte offset of every record in metadata.jsonl
+        ivf.npz / hnsw.bin     optional ANN structures
+        ivf_vectors.npy        IVF only: the vectors reordered so every list is contiguous
+
+    Loading only maps the files; vectors and metadata are paged in on access.
+    Scores are cosine similarities.
+    """
+
+    def __init__(self, path, manifest, vectors, offsets, ivf=None, hnsw=None):
+        self.path = path
+        self.manifest = manifest
+        self.vectors = vectors
+        self.offsets = offsets
+        self.ivf = ivf
+        self.hnsw = hnsw
+        self._metadata_file = open(os.path.join(path, METADATA_FILE), "rb")
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def model(self):
+        return self.manifest.get("model")
+
+    @classmethod
+    def build(
+        cls, path, vectors, texts, metadatas=None, model=None, dtype="float32", ann=None, nlist=None, swap=True
+    ):
+        """
+        Write a new index to `path` and return it loaded.
+
+        By default the index is written to a sibling `<path>.new` directory and
+        renamed into place, so rebuilding never disturbs a reader of `path`.
+
+        Args:
+            path (str): Output directory
+            vectors: Array-like of shape (n, dim)
+            texts (list): Chunk text for every row
+            metadatas (list): Optional metadata dict for every row
+            model (str): Name of the embedding model that produced the vectors
+            dtype (str): Storage dtype, "float32" or "float16"
+            ann (str): None, "ivf" or "hnsw" (requires hnswlib)
+            nlist (int): Number of IVF lists (default: ~sqrt(n))
+            swap (bool): Stage and rename; False writes into `path` directly,
+                e.g. into a staging directory the caller swaps in itself
+
+        Returns:
+            VectorIndex: The freshly written index
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        if swap:
+            staging = path.rstrip(os.sep) + ".new"
+            if os.path.exists(staging):
+                shutil.rmtree(staging)
+            cls.build(staging, vectors, texts, metadatas, model, dtype, ann, nlist, swap=False).close()
+            replace_directory(staging, path.rstrip(os.sep))
+            return cls.load(path)
+        os.makedirs(path, exist_ok=True)
+        matrix = _normalize(vectors)
+        n, dim = matrix.shape if matrix.ndim == 2 else (0, 0)
+        metadatas = metadatas or [{} for _ in texts]
+        if not (n == len(texts) == len(metadatas)):
+            raise ValueError("vectors, texts and metadatas must have the same length")
+
+        np.save(os.path.join(path, VECTORS_FILE), matrix.astype(dtype))
+
+        offsets = np.zeros(n, dtype=np.uint64)
+        with open(os.path.join(path, METADATA_FILE), "wb") as f:
+            for i, (text, metadata) in enumerate(zip(texts, metadatas)):
+                offsets[i] = f.tell()
+                record = {"id": i, "text": text, "metadata": metadata}
+                f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        np.save(os.path.join(path, OFFSETS_FILE), offsets)
+
+        for stale in (IVF_FILE, IVF_VECTORS_FILE, HNSW_FILE):
+            if os.path.exists(os.path.join(path, stale)):
+                os.remove(os.path.join(path, stale))
+
+        if ann == "ivf" and n:
+            nlist = nlist or max(1, int(np.sqrt(n)))
+            centroids = _kmeans(matrix, min(nlist, n))
+            assign = np.argmax(matrix @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable").astype(np.int64)
+            list_offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1)).astype(np.int64)
+            np.savez(os.path.join(path, IVF_FILE), centroids=centroids, order=order, list_offsets=list_offsets)
+            np.save(os.path.join(path, IVF_VECTORS_FILE), matrix[order].astype(dtype))
+        elif ann == "hnsw" and n:
+            import hnswlib
+            index = hnswlib.Index(space="ip", dim=dim)
+            index.init_index(max_elements=n, ef_construction=200, M=16)
+            index.add_items(matrix, np.arange(n))
+            index.save_index(os.path.join(path, HNSW_FILE))
+        elif ann not in (None, "ivf", "hnsw"):
+            raise ValueError(f"Unknown ANN type: {ann}")
+
+        # An empty index has no ANN structure to load
+        manifest = {
+            "model": model,
+            "dim": int(dim),
+            "count": int(n),
+            "dtype": dtype,
+            "ann": ann if n else None,
+            "build_id": uuid.uuid4().hex,
+        }
+        with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map an index previously written by `build`."""
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+
+        ivf = hnsw = None
+        if manifest.get("ann") == "ivf":
+            with np.load(os.path.join(path, IVF_FILE)) as data:
+                ivf = {key: data[key] for key in data.files}
+            ivf["vectors"] = np.load(os.path.join(path, IVF_VECTORS_FILE), mmap_mode="r")
+        elif manifest.get("ann") == "hnsw":
+            import hnswlib
+            hnsw = hnswlib.Index(space="ip", dim=manifest["dim"])
+            hnsw.load_index(os.path.join(path, HNSW_FILE), max_elements=manifest["count"])
+        return cls(path, manifest, vectors, offsets, ivf=ivf, hnsw=hnsw)
+
+    def close(self):
+        self._metadata_file.close()
+
+    def get(self, row):
+        """Return the stored record ({"id", "text", "metadata"}) for a row."""
+        if not 0 <= row < len(self):
+            raise IndexError(f"Row {row} out of range")
+        self._metadata_file.seek(int(self.offsets[row]))
+        return json.loads(self._metadata_file.readline())
+
+    def search_exact(self, queries, k=5, rows=None, block_bytes=64 * 2**20):
+        """
+        Exact top-k by brute force, scoring all queries against the matrix in blocks.
+
+        Args:
+            queries: Array-like of shape (b, dim) or (dim,)
+            k (int): Number of results per query
+            rows: Optional array of candidate rows to restrict the search to
+            block_bytes (int): Size of the float32 copy of each scored block, bounds peak memory
+
+        Returns:
+            tuple: (indices, scores) arrays of shape (b, k)
+        """
+        q = _normalize(np.atleast_2d(queries))
+        candidates = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        best_idx = np.empty((q.shape[0], 0), dtype=np.int64)
+        best_scores = np.empty((q.shape[0], 0), dtype=np.float32)
+        block_size = max(1, block_bytes // (4 * max(1, self.vectors.shape[1])))
+        for start in range(0, len(candidates), block_size):
+            block_rows = candidates[start:start + block_size]
+            if rows is None:
+                block = self.vectors[block_rows[0]:block_rows[-1] + 1]
+            else:
+                block = self.vectors[block_rows]
+            scores = q @ np.asarray(block, dtype=np.float32).T
+            idx, top = _top_k(scores, k)
+            best_idx = np.concatenate([best_idx, block_rows[idx]], axis=1)
+            best_scores = np.concatenate([best_scores, top], axis=1)
+            if best_idx.shape[1] > k:
+                keep, best_scores = _top_k(best_scores, k)
+                best_idx = np.take_along_axis(best_idx, keep, axis=1)
+        return best_idx, best_scores
+
+    def search_candidates(self, queries, candidates, k=5):
+        """
+        Exact top-k per query, each restricted to its own candidate rows.
+
+        The union of all candidate rows is read once and scored against every
+        query in a single matrix product.
+
+        Args:
+            queries: Array-like of shape (b, dim) or (dim,)
+            candidates (list): For each query, an array of unique candidate rows
+            k (int): Number of results per query
+
+        Returns:
+            list: For each query, a list of (row, score) tuples, best first
+        """
+        q = _normalize(np.atleast_2d(queries))
+        candidates = [np.asarray(rows, dtype=np.int64) for rows in candidates]
+        union = np.unique(np.concatenate(candidates)) if candidates else np.empty(0, dtype=np.int64)
+        scores = q @ np.asarray(self.vectors[union], dtype=np.float32).T
+        results = []
+        for i, rows in enumerate(candidates):
+            idx, top = _top_k(scores[i:i + 1, np.searchsorted(union, rows)], k)
+            results.append([(int(r), float(s)) for r, s in zip(rows[idx[0]], top[0])])
+        return results
+
+    def _search_ivf(self, q, k, nprobe):
+        """
+        Probe the `nprobe` nearest lists per query.
+
+        Each probed list is a contiguous slice of the reordered vectors; it is
+        read (and upcast) once and scored against every query that probes it.
+        """
+        centroids, vectors = self.ivf["centroids"], self.ivf["vectors"]
+        order, list_offsets = self.ivf["order"], self.ivf["list_offsets"]
+        probes, _ = _top_k(q @ centroids.T, nprobe)
+        best_idx = np.full((q.shape[0], k), -1, dtype=np.int64)
+        best_scores = np.full((q.shape[0], k), -np.inf, dtype=np.float32)
+        for c in np.unique(probes):
+            start, end = list_offsets[c], list_offsets[c + 1]
+            if start == end:
+                continue
+            members = np.flatnonzero((probes == c).any(axis=1))
+            scores = q[members] @ np.asarray(vectors[start:end], dtype=np.float32).T
+            idx, top = _top_k(scores, k)
+            merged_idx = np.concatenate([best_idx[members], order[start:end][idx]], axis=1)
+            merged_scores = np.concatenate([best_scores[members], top], axis=1)
+            keep, best_scores[members] = _top_k(merged_scores, k)
+            best_idx[members] = np.take_along_axis(merged_idx, keep, axis=1)
+        found = best_idx >= 0
+        return [row[mask] for row, mask in zip(best_idx, found)], [row[mask] for row, mask in zip(best_scores, found)]
+
+    def search(self, queries, k=5, exact=False, nprobe=8, ef=64):
+        """
+        Top-k cosine search, using the ANN structure when one was built.
+
+        Args:
+            queries: Array-like of shape (b, dim) or (dim,)
+            k (int): Number of results per query
+            exact (bool): Force brute-force search even if an ANN index exists
+            nprobe (int): IVF lists probed per query
+            ef (int): HNSW search breadth
+
+        Returns:
+            list: For each query, a list of (row, score) tuples, best first
+        """
+        q = _normalize(np.atleast_2d(queries))
+        if exact or (self.ivf is None and self.hnsw is None):
+            idx, scores = self.search_exact(q, k)
+        elif self.ivf is not None:
+            idx, scores = self._search_ivf(q, k, nprobe)
+        else:
+            self.hnsw.set_ef(max(ef, k))
+            labels, distances = self.hnsw.knn_query(q, k=min(k, len(self)))
+            idx, scores = labels, 1.0 - distances
+        return [
+            [(int(r), float(s)) for r, s in zip(row_idx, row_scores)]
+            for row_idx, row_scores in zip(idx, scores)
+        ]
+
+
+def recall_at_k(index, queries, k=10, **search_kwargs):
+    """Fraction of exact top-k neighbours recovered by `index.search`."""
+    exact = index.search(queries, k, exact=True)
+    approx = index.search(queries, k, **search_kwargs)
+    hits = sum(len({r for r, _ in e} & {r for r, _ in a}) for e, a in zip(exact, approx))
+    return hits / max(1, sum(len(e) for e in exact))
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser(description="Benchmark exact vs ANN vector search")
+    parser.add_argument("--rows", type=int, default=50_000, help="Number of indexed vectors")
+    parser.add_argument("--dim", type=int, default=3072, help="Vector dimension")
+    parser.add_argument("--queries", type=int, default=64, help="Number of queries")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument("--dtype", default="float16", help="Storage dtype (float32 or float16)")
+    parser.add_argument("--ann", default="ivf", help="ANN type (ivf or hnsw)")
+    parser.add_argument("--nprobe", type=int, default=8, help="IVF lists probed per query")
+    args = parser.parse_args()
+
+    # Clustered synthetic data so ANN recall is meaningful
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((256, args.dim)).astype(np.float32)
+    data = centers[rng.integers(0, 256, args.rows)] + 0.5 * rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+    queries = data[rng.choice(args.rows, args.queries, replace=False)] + 0.1 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    texts = [f"chunk {i}" for i in range(args.rows)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        VectorIndex.build(tmp, data, texts, dtype=args.dtype, ann=args.ann).close()
+        print(f"build: {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        index = VectorIndex.load(tmp)
+        print(f"load:  {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        for label, kwargs in (("exact", {"exact": True}), (args.ann, {"nprobe": args.nprobe})):
+            start = time.perf_counter()
+            index.search(queries, args.k, **kwargs)
+            elapsed = time.perf_counter() - start
+            print(f"{label:>5}: {elapsed * 1000 / args.queries:.2f}ms/query")
+        print(f"recall@{args.k}: {recall_at_k(index, queries, args.k, nprobe=args.nprobe):.3f}")
+        index.close()
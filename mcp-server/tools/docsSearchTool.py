@@ -0,0 +1,267 @@
+import os
+import sys
+import json
+import time
+import asyncio
+from collections import OrderedDict
+
+import numpy as np
+
+from mcp.server.fastmcp import FastMCP
+
+# Allow running as a script (python3 tools/docsSearchTool.py) as well as a module
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper_functions.embeddingPipeline import create_embeddings
+from helper_functions.vectorIndex import MANIFEST_FILE, VectorIndex
+from helper_functions.lexicalIndex import LexicalIndex, fuse_hybrid
+
+mcp = FastMCP("docs-search-tool")
+
+INDEX_PATH = os.getenv("DOCS_INDEX_PATH", os.path.join(os.getcwd(), "vector_index"))
+MAX_K = 20
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+SNIPPET_CHARS = 500
+HYBRID_CANDIDATES = 200
+
+
+class DocsSearcher:
+    """
+    Serves a persisted VectorIndex to concurrent MCP tool calls.
+
+    The index is memory-mapped once, query embeddings are kept in an LRU cache
+    (backed by the on-disk embedding cache), and vector queries arriving within
+    `batch_window` seconds of each other are scored in one vectorized pass.
+    When a BM25 index is stored next to the vectors, hybrid queries only score
+    their lexical candidates (batched the same way) and lexical queries need
+    no embedding call at all.
+
+    A rebuilt index is renamed into place with a new build ID; the searcher
+    checks for one every `reload_interval` seconds and switches to it, while
+    requests already in flight finish against the index they started on.
+    """
+
+    def __init__(self, index_path, batch_window=0.005, max_batch=64, query_cache_size=1024, reload_interval=5.0):
+        self.index_path = index_path
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.query_cache_size = query_cache_size
+        self.reload_interval = reload_interval
+        self.embeddings = None
+        self._query_cache = OrderedDict()
+        self._pending = []
+        self._flush_handle = None
+        self._load()
+
+    def _load(self):
+        self.index = VectorIndex.load(self.index_path)
+        self.lexical = LexicalIndex.load(self.index_path) if LexicalIndex.exists(self.index_path) else None
+        model = self.index.model or "text-embedding-3-large"
+        if self.embeddings is None or self.embeddings.model != model:
+            backend = "local" if model.startswith("local-hash") else "openai"
+            self.embeddings = create_embeddings(backend, model=model)
+            self._query_cache.clear()
+        self._checked_at = time.monotonic()
+
+    def _maybe_reload(self):
+        """Switch to a newly swapped-in index if its build ID changed."""
+        if time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            with open(os.path.join(self.index_path, MANIFEST_FILE)) as f:
+                build_id = json.load(f).get("build_id")
+            if build_id != self.index.manifest.get("build_id"):
+                # The old index is not closed: pending requests still read it
+                self._load()
+        except (OSError, ValueError) as e:
+            # Caught mid-swap or mid-write; keep serving the current index
+            print(f"Index reload skipped: {e}", file=sys.stderr)
+
+    async def embed_query(self, query):
+        if query in self._query_cache:
+            self._query_cache.move_to_end(query)
+            return self._query_cache[query]
+        vector = await self.embeddings.aembed_query(query)
+        self._query_cache[query] = vector
+        if len(self._query_cache) > self.query_cache_size:
+            self._query_cache.popitem(last=False)
+        return vector
+
+    async def search(self, query, k=5, mode="hybrid"):
+        """
+        Return a list of (record, score) for a query in the given search mode.
+
+        Records are read from the same index the hits were scored against,
+        even if a reload happens while the query is waiting.
+        """
+        self._maybe_reload()
+        index, lexical = self.index, self.lexical
+        if lexical is None:
+            mode = "vector"
+        if mode == "lexical":
+            hits = lexical.search(query, k)
+        else:
+            vector = await self.embed_query(query)
+            lexical_hits = lexical.search(query, HYBRID_CANDIDATES) if mode == "hybrid" else []
+            if lexical_hits:
+                rows = np.sort(np.array([row for row, _ in lexical_hits], dtype=np.int64))
+                vector_hits = await self._search_vector(index, vector, k * 4, rows)
+                hits = fuse_hybrid(lexical_hits, vector_hits, k=k)
+            else:
+                hits = await self._search_vector(index, vector, k)
+        return [(index.get(row), score) for row, score in hits]
+
+    async def _search_vector(self, index, vector, k, rows=None):
+        """Vector search over all rows or only `rows`, batched with concurrent callers."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((index, vector, k, rows, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        # Callers that were cancelled while waiting no longer need a result
+        batch, self._pending = [item for item in self._pending if not item[4].done()], []
+        # Normally a single group; two only while a reload is in progress
+        groups = {}
+        for item in batch:
+            groups.setdefault((id(item[0]), item[3] is None), []).append(item)
+        for items in groups.values():
+            self._score(items)
+
+    @staticmethod
+    def _score(items):
+        index = items[0][0]
+        try:
+            if items[0][3] is None:
+                results = index.search(
+                    [vector for _, vector, _, _, _ in items], k=max(k for _, _, k, _, _ in items)
+                )
+            else:
+                results = index.search_candidates(
+                    [vector for _, vector, _, _, _ in items],
+                    [rows for _, _, _, rows, _ in items],
+                    k=max(k for _, _, k, _, _ in items),
+                )
+        except Exception as e:
+            for *_, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, k, _, future), hits in zip(items, results):
+            if not future.done():
+                future.set_result(hits[:k])
+
+
+searcher = None
+
+
+def get_searcher():
+    global searcher
+    if searcher is None:
+        searcher = DocsSearcher(INDEX_PATH)
+    return searcher
+
+
+def format_hit(record, score):
+    """Format a search hit into a readable string."""
+    source = record["metadata"].get("source", "Unknown URL")
+    snippet = record["text"][:SNIPPET_CHARS].strip()
+    return f"""
+ID: {record['id']}
+Source: {source}
+Score: {score:.4f}
+Snippet: {snippet}
+"""
+
+
+@mcp.tool()
+async def search_docs(query: str, k: int = 5, mode: str = "hybrid") -> str:
+    """Search the documentation index for chunks relevant to a query.
+
+    Args:
+        query: Natural language or keyword query
+        k: Number of results to return (1-20)
+        mode: "hybrid" (keyword + semantic), "vector" (semantic only) or
+            "lexical" (keyword only, best for exact API names)
+    """
+    if mode not in SEARCH_MODES:
+        return f"Unknown search mode '{mode}'. Use one of: {', '.join(SEARCH_MODES)}."
+    docs = get_searcher()
+    k = max(1, min(k, MAX_K))
+    hits = await docs.search(query, k, mode)
+    if not hits:
+        return "No matching documents found."
+    return "\n---\n".join(format_hit(record, score) for record, score in hits)
+
+
+@mcp.tool()
+async def get_document(id: int) -> str:
+    """Get the full text of a documentation chunk returned by search_docs.
+
+    Args:
+        id: The chunk ID from a search_docs result
+    """
+    docs = get_searcher()
+    try:
+        record = docs.index.get(id)
+    except IndexError:
+        return f"No document with ID {id}."
+    source = record["metadata"].get("source", "Unknown URL")
+    return f"SOURCE: {source}\nCONTENT:\n{record['text']}"
+
+
+def create_starlette_app(mcp_server, *, debug=False):
+    """Create a Starlette application that serves the MCP server with SSE."""
+    from mcp.server.sse import SseServerTransport
+    from starlette.applications import Starlette
+    from starlette.routing import Mount, Route
+
+    sse = SseServerTransport("/messages/")
+
+    async def handle_sse(request):
+        async with sse.connect_sse(
+                request.scope,
+                request.receive,
+                request._send,  # noqa: SLF001
+        ) as (read_stream, write_stream):
+            await mcp_server.run(
+                read_stream,
+                write_stream,
+                mcp_server.create_initialization_options(),
+            )
+
+    return Starlette(
+        debug=debug,
+        routes=[
+            Route("/sse", endpoint=handle_sse),
+            Mount("/messages/", app=sse.handle_post_message),
+        ],
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the documentation search MCP server')
+    parser.add_argument('--transport', default='stdio', choices=['stdio', 'sse'], help='MCP transport')
+    parser.add_argument('--index', default=INDEX_PATH, help='Path to the vector index directory')
+    parser.add_argument('--host', default='0.0.0.0', help='Host to bind to (sse)')
+    parser.add_argument('--port', type=int, default=8081, help='Port to listen on (sse)')
+    args = parser.parse_args()
+
+    # Map the index once at startup so the first query is served warm
+    INDEX_PATH = args.index
+    get_searcher()
+
+    if args.transport == "stdio":
+        mcp.run(transport="stdio")
+    else:
+        import uvicorn
+        uvicorn.run(create_starlette_app(mcp._mcp_server), host=args.host, port=args.port)  # noqa: WPS437